@@ -3,15 +3,23 @@ import streamlit as st
 import pandas as pd
 import json
 import os
+import shutil
 from datetime import datetime
 from io import StringIO
 
 # Import modules
-from modules.matrix import define_matrix_structure
-from modules.copy_generator import get_claude_prompt, display_copy_generation_instructions
+from modules.matrix import define_matrix_structure, DEFAULT_PERSONAS, DEFAULT_PROPERTY_TYPES, DEFAULT_LOCATIONS
+from modules.copy_generator import get_claude_prompt, display_copy_generation_instructions, plan_copy_prompts, find_missing_copy, merge_copy_data, COPY_CSV_COLUMNS, DEFAULT_MAX_ROWS_PER_PROMPT
 from modules.csv_generator import create_master_csv
-from modules.campaign_generator import generate_facebook_campaign_structure
-from modules.utils import display_instructions, preview_dataframe, preview_json, create_directory_if_not_exists, validate_csv_format
+from modules.campaign_generator import generate_facebook_campaign_structure, write_campaign_budgets, DEFAULT_CHUNK_SIZE
+from modules.dedup import detect_duplicate_ads, collapse_duplicate_ads, CLUSTER_COLUMNS
+from modules.jobs import JobManager, new_session_id, is_valid_session_id
+from modules.artifact_store import ArtifactStore, file_digest
+from modules.budget import allocate_budgets
+from modules.overlap import find_overlapping_ad_sets
+from modules.packing import DEFAULT_MAX_ADS_PER_AD_SET
+from modules.models import campaigns_from_json, campaigns_to_json, matrix_to_json
+from modules.utils import display_instructions, preview_dataframe, preview_json, create_directory_if_not_exists, validate_csv_format, display_job_progress, parse_weight_lines, load_text_asset
 
 # Page config
 st.set_page_config(
@@ -20,14 +28,20 @@ st.set_page_config(
     layout="wide"
 )
 
-# Create assets directory if it doesn't exist
-create_directory_if_not_exists("assets")
-
-# Ensure the claude prompt file exists
 claude_prompt_file = "assets/claude_prompt.txt"
-if not os.path.exists(claude_prompt_file):
-    with open(claude_prompt_file, "w") as f:
-        f.write(get_claude_prompt())
+
+@st.cache_resource
+def prepare_assets():
+    """Create missing asset files once per process"""
+    # Create assets directory if it doesn't exist
+    create_directory_if_not_exists("assets")
+    
+    # Ensure the claude prompt file exists
+    if not os.path.exists(claude_prompt_file):
+        with open(claude_prompt_file, "w") as f:
+            f.write(get_claude_prompt())
+
+prepare_assets()
 
 # Initialize session state variables
 if "matrix_data" not in st.session_state:
@@ -36,8 +50,309 @@ if "copy_data" not in st.session_state:
     st.session_state.copy_data = None
 if "master_csv" not in st.session_state:
     st.session_state.master_csv = None
-if "campaign_json" not in st.session_state:
-    st.session_state.campaign_json = None
+if "campaign_model" not in st.session_state:
+    st.session_state.campaign_model = None
+if "campaign_json_path" not in st.session_state:
+    st.session_state.campaign_json_path = None
+if "budgeted_campaign_json_path" not in st.session_state:
+    st.session_state.budgeted_campaign_json_path = None
+if "master_csv_path" not in st.session_state:
+    st.session_state.master_csv_path = None
+
+@st.cache_resource
+def get_job_manager():
+    """Background job manager shared by all sessions of this process"""
+    job_manager = JobManager(base_dir="temp/sessions")
+    job_manager.cleanup_stale_workspaces()
+    return job_manager
+
+job_manager = get_job_manager()
+
+# Each browser session gets its own workspace; the id is kept in the URL so a
+# refresh re-attaches to the session's running jobs
+if "session_id" not in st.session_state:
+    session_id = st.query_params.get("session")
+    st.session_state.session_id = session_id if is_valid_session_id(session_id) else new_session_id()
+if st.query_params.get("session") != st.session_state.session_id:
+    st.query_params["session"] = st.session_state.session_id
+workspace = job_manager.workspace(st.session_state.session_id)
+
+@st.cache_resource
+def get_artifact_store():
+    """Artifact store shared by all sessions and processes using the same temp directory"""
+    return ArtifactStore(root="temp/artifacts")
+
+artifact_store = get_artifact_store()
+
+def run_master_csv_job(matrix_data, copy_csv_path, duplicate_mode, progress_callback=None):
+    """Build the master CSV and optionally flag or collapse duplicate copy, reusing stored artifacts"""
+    inputs = {
+        "dimensions": {key: matrix_data[key] for key in ["personas", "funnel_stages", "property_types", "locations"]},
+        "rules": matrix_data.get("pruning", {}).get("rules", []),
+        "copy_csv": file_digest(copy_csv_path),
+        "duplicate_mode": duplicate_mode
+    }
+    # The master CSV and its duplicate clusters are built together under one lock
+    keys = {"master_csv": artifact_store.key("master_csv", inputs)}
+    if duplicate_mode != "Keep all ads":
+        keys["duplicate_clusters"] = artifact_store.key("duplicate_clusters", inputs)
+    
+    # Progress updates are also where a cancelled job stops, so every long phase reports
+    report = progress_callback if progress_callback is not None else lambda fraction, message=None: None
+    
+    def build(paths):
+        dedup = "duplicate_clusters" in paths
+        master_share = 0.5 if dedup else 1.0
+        create_master_csv(
+            matrix_data, copy_csv_path, output_file=paths["master_csv"],
+            progress_callback=lambda fraction, message=None: report(master_share * fraction, message)
+        )
+        
+        if dedup:
+            report(0.5, "Detecting duplicate ad copy...")
+            master_df, duplicate_clusters = detect_duplicate_ads(
+                pd.read_csv(paths["master_csv"]),
+                progress_callback=lambda fraction, message=None: report(0.5 + 0.4 * fraction, message)
+            )
+            if duplicate_mode.startswith("Collapse"):
+                report(0.9, "Collapsing duplicate ads...")
+                master_df = collapse_duplicate_ads(master_df, include_near=duplicate_mode == "Collapse exact and near duplicates")
+            report(0.95, "Writing master CSV...")
+            master_df.to_csv(paths["master_csv"], index=False)
+            
+            with open(paths["duplicate_clusters"], "w", encoding="utf-8") as f:
+                f.write(duplicate_clusters.to_json(orient="records", force_ascii=False))
+    
+    paths = artifact_store.get_or_build_all(
+        keys, build, on_wait=lambda: report(0.0, "Waiting for another session building the same master CSV...")
+    )
+    
+    duplicate_clusters = None
+    if "duplicate_clusters" in paths:
+        with open(paths["duplicate_clusters"], "r", encoding="utf-8") as f:
+            duplicate_clusters = pd.DataFrame(json.load(f), columns=CLUSTER_COLUMNS)
+    
+    # Worker threads cannot draw on the page, so missing copy is returned for the script to show
+    missing_copy = find_missing_copy(matrix_data, pd.read_csv(copy_csv_path))
+    
+    return {"master_csv": pd.read_csv(paths["master_csv"]), "duplicate_clusters": duplicate_clusters, "missing_copy": missing_copy}
+
+def run_campaign_job(master_csv_path, chunksize=None, max_ads_per_ad_set=None, max_ads_per_campaign=None, progress_callback=None):
+    """
+    Build the campaign structure JSON packed into the ad limits, reusing stored artifacts for the same inputs
+    
+    Large master CSVs are streamed, so their structure stays on disk: the
+    model is loaded from the summary with ad counts only and the JSON file is
+    linked into the session workspace for the download.
+    """
+    inputs = {
+        "master_csv": file_digest(master_csv_path),
+        "max_ads_per_ad_set": max_ads_per_ad_set,
+        "max_ads_per_campaign": max_ads_per_campaign
+    }
+    keys = {
+        "campaign_json": artifact_store.key("campaign_json", inputs),
+        "campaign_summary": artifact_store.key("campaign_summary", inputs)
+    }
+    paths = artifact_store.get_or_build_all(
+        keys,
+        lambda paths: generate_facebook_campaign_structure(
+            master_csv_path, paths["campaign_json"], progress_callback=progress_callback,
+            chunksize=chunksize, spill_dir=workspace,
+            max_ads_per_ad_set=max_ads_per_ad_set, max_ads_per_campaign=max_ads_per_campaign,
+            summary_file=paths["campaign_summary"]
+        ),
+        on_wait=None if progress_callback is None else lambda: progress_callback(0.0, "Waiting for another session building the same campaign structure...")
+    )
+    with open(paths["campaign_summary"], "r", encoding="utf-8") as f:
+        summary = json.load(f)
+    
+    if chunksize is None:
+        with open(paths["campaign_json"], "r", encoding="utf-8") as f:
+            campaign_model = campaigns_from_json(json.load(f))
+        campaign_json_path = None
+    else:
+        campaign_model = campaigns_from_json(summary["campaigns"])
+        # The session keeps its own link so eviction from the store cannot remove the download
+        campaign_json_path = artifact_store.export(paths["campaign_json"], os.path.join(workspace, "campaign_structure.json"))
+    return {"campaign_model": campaign_model, "campaign_json_path": campaign_json_path, "packing": summary["packing"]}
+
+def start_master_csv_job(duplicate_mode):
+    """Submit master CSV generation for the current session"""
+    copy_csv_path = os.path.join(workspace, "copy_data.csv")
+    st.session_state.copy_data.to_csv(copy_csv_path, index=False)
+    
+    output_file = f"facebook_ads_master_{datetime.now().strftime('%Y%m%d')}.csv"
+    return job_manager.submit(
+        st.session_state.session_id, "master_csv", run_master_csv_job,
+        st.session_state.matrix_data, copy_csv_path, duplicate_mode,
+        label=output_file
+    )
+
+def start_campaign_job(max_ads_per_ad_set=DEFAULT_MAX_ADS_PER_AD_SET, max_ads_per_campaign=None):
+    """Submit campaign structure generation for the current session"""
+    chunksize = None
+    if st.session_state.master_csv is not None:
+        master_csv_path = os.path.join(workspace, "master_csv.csv")
+        st.session_state.master_csv.to_csv(master_csv_path, index=False)
+    else:
+        # Large uploaded master CSVs stay on disk and are read in chunks
+        master_csv_path = st.session_state.master_csv_path
+        chunksize = DEFAULT_CHUNK_SIZE
+    
+    output_file = f"facebook_campaign_structure_{datetime.now().strftime('%Y%m%d')}.json"
+    return job_manager.submit(
+        st.session_state.session_id, "campaign_json", run_campaign_job,
+        master_csv_path, chunksize=chunksize,
+        max_ads_per_ad_set=max_ads_per_ad_set, max_ads_per_campaign=max_ads_per_campaign,
+        label=output_file
+    )
+
+def collect_master_csv_job(job):
+    """Load a finished master CSV job into session state once"""
+    if st.session_state.get("master_csv_job_id") != job.job_id:
+        st.session_state.master_csv = job.result["master_csv"]
+        st.session_state.master_csv_job_id = job.job_id
+
+def display_missing_copy(job):
+    """Warn about persona-stage combinations a finished master CSV job had no copy for"""
+    missing_copy = job.result["missing_copy"]
+    if missing_copy:
+        missing_names = [f"{persona_id}_{funnel_stage}" for persona_id, funnel_stage in missing_copy]
+        st.warning(f"Missing copy for {len(missing_names)} persona-stage combinations: {', '.join(missing_names)}")
+
+def collect_campaign_job(job):
+    """Load a finished campaign job into session state once"""
+    if st.session_state.get("campaign_json_job_id") != job.job_id:
+        st.session_state.campaign_model = job.result["campaign_model"]
+        st.session_state.campaign_json_path = job.result["campaign_json_path"]
+        st.session_state.budgeted_campaign_json_path = None
+        st.session_state.budget_allocation = None
+        st.session_state.campaign_json_job_id = job.job_id
+
+@st.fragment
+def render_matrix_prompts():
+    """Copy prompts planned from the current matrix; changing the batch size reruns only this section"""
+    max_rows_per_prompt = st.number_input(
+        "Maximum rows per prompt", min_value=1, value=DEFAULT_MAX_ROWS_PER_PROMPT, step=1,
+        help="Large matrices are split into several prompts; paste each into Claude and combine the rows"
+    )
+    prompt_plan = plan_copy_prompts(st.session_state.matrix_data, max_rows_per_prompt=int(max_rows_per_prompt))
+    st.write(f"{sum(len(plan['cells']) for plan in prompt_plan)} persona-stage combinations in {len(prompt_plan)} prompts")
+    for index, plan in enumerate(prompt_plan, start=1):
+        st.text_area(f"Prompt {index} ({len(plan['cells'])} rows)", plan["prompt"], height=200)
+
+@st.fragment
+def render_budget_allocation():
+    """Budget allocation section; the form reruns only this section until budgets are written"""
+    with st.form("budget_form"):
+        total_budget = st.number_input("Total daily budget", min_value=0.0, value=1000.0, step=50.0)
+        
+        st.write("Weight per campaign objective")
+        objective_columns = st.columns(4)
+        stage_weights = {}
+        for column, objective in zip(objective_columns, ["BRAND_AWARENESS", "TRAFFIC", "LEAD_GENERATION", "CONVERSIONS"]):
+            stage_weights[objective] = column.number_input(objective, min_value=0.0, value=1.0, step=0.1)
+        
+        budget_columns = st.columns(2)
+        min_budget = budget_columns[0].number_input("Minimum per ad set location", min_value=0.0, value=1.0)
+        max_budget = budget_columns[1].number_input("Maximum per ad set location (0 = no limit)", min_value=0.0, value=0.0)
+        
+        persona_priors_text = st.text_area("Persona priors (one 'persona_id: weight' per line)", "")
+        location_priors_text = st.text_area("Location priors (one 'location: weight' per line)", "")
+        
+        allocate = st.form_submit_button("Allocate Budgets")
+    
+    if allocate:
+        try:
+            budget_allocation = allocate_budgets(
+                st.session_state.campaign_model,
+                total_budget,
+                stage_weights=stage_weights,
+                persona_priors=parse_weight_lines(persona_priors_text),
+                location_priors=parse_weight_lines(location_priors_text),
+                min_budget=min_budget,
+                max_budget=max_budget or None
+            )
+            # Structures kept on disk get a budgeted copy of their JSON file for the download
+            if st.session_state.campaign_json_path is not None:
+                with st.spinner("Writing budgets into the campaign structure..."):
+                    st.session_state.budgeted_campaign_json_path = write_campaign_budgets(
+                        st.session_state.campaign_json_path,
+                        st.session_state.campaign_model,
+                        os.path.join(workspace, "campaign_structure_budgeted.json")
+                    )
+            st.session_state.budget_allocation = budget_allocation
+            # The preview and download show the budgets, so redraw the whole page once
+            st.rerun()
+        except ValueError as e:
+            st.error(f"Could not allocate budgets: {str(e)}")
+    
+    budget_allocation = st.session_state.get("budget_allocation")
+    if budget_allocation is not None:
+        st.success(f"Allocated {budget_allocation['daily_budget'].sum():.2f} across {len(budget_allocation)} ad set locations")
+        st.dataframe(budget_allocation)
+        st.download_button(
+            label="Download Budgets (CSV)",
+            data=budget_allocation.to_csv(index=False),
+            file_name="budget_allocation.csv",
+            mime="text/csv"
+        )
+
+@st.fragment
+def render_overlap_analysis():
+    """Audience overlap section; analyzing reruns only this section"""
+    st.write("Ad sets that target the same people compete with each other in auctions.")
+    with st.form("overlap_form"):
+        overlap_columns = st.columns(2)
+        min_overlap = overlap_columns[0].slider("Minimum overlap to report", 0.0, 1.0, 0.5)
+        interest_weight = overlap_columns[1].slider(
+            "Interest weight", 0.0, 1.0, 0.0,
+            help="0 scores age and location only; 1 also multiplies in the shared share of interests"
+        )
+        analyze = st.form_submit_button("Analyze Overlap")
+    
+    if analyze:
+        overlap_pairs, overlap_summary = find_overlapping_ad_sets(
+            st.session_state.campaign_model,
+            min_overlap=min_overlap,
+            top=100,
+            interest_weight=interest_weight
+        )
+        st.write(f"Most overlapping pairs ({len(overlap_pairs)} shown):")
+        st.dataframe(overlap_pairs)
+        st.write("Ad set locations with the most overlapping peers:")
+        st.dataframe(overlap_summary.head(20))
+
+@st.fragment
+def render_campaign_preview(output_file):
+    """Campaign structure preview and download; not redrawn when the budget or overlap sections rerun"""
+    preview_json(st.session_state.campaign_model)
+    
+    # Download option; structures built from large master CSVs are served from disk
+    campaign_json_path = st.session_state.budgeted_campaign_json_path or st.session_state.campaign_json_path
+    if campaign_json_path is not None:
+        with open(campaign_json_path, "rb") as f:
+            st.download_button(
+                label="Download Campaign Structure (JSON)",
+                data=f,
+                file_name=output_file,
+                mime="application/json"
+            )
+    else:
+        json_data = json.dumps(campaigns_to_json(st.session_state.campaign_model), indent=2)
+        st.download_button(
+            label="Download Campaign Structure (JSON)",
+            data=json_data,
+            file_name=output_file,
+            mime="application/json"
+        )
+
+# Pick up results of background jobs that finished since the last run
+for job_kind, collect_job in [("master_csv", collect_master_csv_job), ("campaign_json", collect_campaign_job)]:
+    finished_job = job_manager.latest_job(st.session_state.session_id, job_kind)
+    if finished_job is not None and finished_job.status == "completed":
+        collect_job(finished_job)
 
 # App title
 st.title("Facebook Ad Generator")
@@ -56,8 +371,7 @@ if page == "Instructions":
     st.header("How to Use This Tool")
     
     # Load instructions from file
-    with open("assets/instructions.txt", "r") as f:
-        instructions = f.read()
+    instructions = load_text_asset("assets/instructions.txt")
     
     # Split the instructions to insert the SVG at the right location
     if "## Data Flow Diagram" in instructions:
@@ -70,7 +384,7 @@ if page == "Instructions":
         
         # Display SVG flowchart
         svg_path = "assets/flowchart.svg"
-        st.image(svg_path, use_column_width=True)
+        st.image(svg_path, use_container_width=True)
         
         # Display rest of instructions
         st.markdown(after_diagram)
@@ -84,89 +398,114 @@ if page == "Instructions":
     with col1:
         if st.button("Start Workflow"):
             st.session_state.page = "All-in-One Workflow"
-            st.experimental_rerun()
+            st.rerun()
     with col2:
         if st.button("Step 1"):
             st.session_state.page = "Step 1: Matrix Structure"
-            st.experimental_rerun()
+            st.rerun()
     with col3:
         if st.button("Step 2"):
             st.session_state.page = "Step 2: Copy Generation"
-            st.experimental_rerun()
+            st.rerun()
     with col4:
         if st.button("Step 3"):
             st.session_state.page = "Step 3: Master CSV"
-            st.experimental_rerun()
+            st.rerun()
     with col5:
         if st.button("Step 4"):
             st.session_state.page = "Step 4: Campaign Structure"
-            st.experimental_rerun()
+            st.rerun()
 
 elif page == "Step 1: Matrix Structure":
     st.header("Step 1: Define Matrix Structure")
     
     display_instructions("Define the core structure for your ad campaigns, including personas, funnel stages, property types, and locations.")
     
-    # Option to customize matrix structure
-    with st.expander("Customize Matrix Structure"):
-        # Personas
-        st.subheader("Personas")
-        persona1_name = st.text_input("Persona 1 Name", "Manuel")
-        persona1_id = st.text_input("Persona 1 ID", "retiree")
-        persona1_age = st.text_input("Persona 1 Age Range", "50-65")
-        persona1_situation = st.text_input("Persona 1 Situation", "retirement planning")
-        
-        st.markdown("---")
-        
-        persona2_name = st.text_input("Persona 2 Name", "Sofía")
-        persona2_id = st.text_input("Persona 2 ID", "family")
-        persona2_age = st.text_input("Persona 2 Age Range", "30-45")
-        persona2_situation = st.text_input("Persona 2 Situation", "family upgrading")
-        
-        st.markdown("---")
-        
-        persona3_name = st.text_input("Persona 3 Name", "Carlos")
-        persona3_id = st.text_input("Persona 3 ID", "investor")
-        persona3_age = st.text_input("Persona 3 Age Range", "35-55")
-        persona3_situation = st.text_input("Persona 3 Situation", "investment properties")
-        
-        # Property types
-        st.subheader("Property Types")
-        property_types_text = st.text_area("Enter property types (one per line)", "casa\ndepartamento\nterreno\nlocal comercial")
+    # All inputs live in one form so editing them does not rerun the page;
+    # the matrix is only rebuilt when the form is submitted
+    with st.form("matrix_form"):
+        # Option to customize matrix structure
+        with st.expander("Customize Matrix Structure"):
+            # Personas
+            st.subheader("Personas")
+            st.write("Add or remove rows to define any number of personas.")
+            personas_df = st.data_editor(
+                pd.DataFrame(DEFAULT_PERSONAS, columns=["id", "name", "age", "situation"]),
+                num_rows="dynamic",
+                use_container_width=True,
+                column_config={
+                    "id": st.column_config.TextColumn("ID", required=True),
+                    "name": st.column_config.TextColumn("Name", required=True),
+                    "age": st.column_config.TextColumn("Age Range"),
+                    "situation": st.column_config.TextColumn("Situation")
+                }
+            )
+            
+            # Property types
+            st.subheader("Property Types")
+            property_types_text = st.text_area("Enter property types (one per line)", "\n".join(DEFAULT_PROPERTY_TYPES))
+            
+            # Locations
+            st.subheader("Locations")
+            locations_text = st.text_area("Enter locations (one per line)", "\n".join(DEFAULT_LOCATIONS))
+            
+            # Combination rules
+            st.subheader("Combination Rules")
+            st.write('Optional JSON list of include/exclude rules, e.g. `[{"action": "exclude", "match": {"persona_id": "family", "property_type": "terreno"}}]`')
+            rules_text = st.text_area("Enter rules (JSON)", "[]")
         
-        # Locations
-        st.subheader("Locations")
-        locations_text = st.text_area("Enter locations (one per line)", "Tampico\nCiudad Madero\nAltamira\nTamaulipas")
+        submitted = st.form_submit_button("Generate Matrix Structure")
     
-    if st.button("Generate Matrix Structure"):
+    if submitted:
         # Parse custom input
         personas = [
-            {"id": persona1_id, "name": persona1_name, "age": persona1_age, "situation": persona1_situation},
-            {"id": persona2_id, "name": persona2_name, "age": persona2_age, "situation": persona2_situation},
-            {"id": persona3_id, "name": persona3_name, "age": persona3_age, "situation": persona3_situation}
+            {key: str(value).strip() if pd.notna(value) else "" for key, value in row.items()}
+            for row in personas_df.to_dict("records")
         ]
+        personas = [persona for persona in personas if persona["id"]]
+        persona_ids = [persona["id"] for persona in personas]
+        
+        if not personas:
+            st.error("Define at least one persona with an ID")
+            st.stop()
+        if len(set(persona_ids)) != len(persona_ids):
+            st.error("Persona IDs must be unique")
+            st.stop()
         
         property_types = [p.strip() for p in property_types_text.strip().split("\n") if p.strip()]
         locations = [l.strip() for l in locations_text.strip().split("\n") if l.strip()]
         
-        # Create custom matrix
-        matrix_data = define_matrix_structure(
-            personas=personas,
-            property_types=property_types,
-            locations=locations
-        )
+        try:
+            rules = json.loads(rules_text) if rules_text.strip() else []
+            
+            # Create custom matrix
+            matrix_data = define_matrix_structure(
+                personas=personas,
+                property_types=property_types,
+                locations=locations,
+                rules=rules
+            )
+        except (ValueError, AttributeError, TypeError) as e:
+            st.error(f"Invalid combination rules: {str(e)}")
+            st.stop()
         
         st.session_state.matrix_data = matrix_data
         
         st.success(f"Matrix structure generated with {len(matrix_data['matrix'])} combinations!")
         
+        # Report pruned combinations per rule
+        if "pruning" in matrix_data:
+            st.write(f"Combination rules removed {matrix_data['pruning']['total_removed']} combinations:")
+            for rule_name, count in matrix_data["pruning"]["removed"].items():
+                st.write(f"- {rule_name}: {count}")
+        
         # Preview
         st.subheader("Preview")
-        preview_df = pd.DataFrame(matrix_data["matrix"][:5])
+        preview_df = pd.DataFrame([cell.to_json() for cell in matrix_data["matrix"][:5]])
         st.dataframe(preview_df)
         
         # Download option
-        matrix_json = json.dumps(matrix_data, indent=2)
+        matrix_json = json.dumps(matrix_to_json(matrix_data), indent=2)
         st.download_button(
             label="Download Matrix Structure (JSON)",
             data=matrix_json,
@@ -183,13 +522,17 @@ elif page == "Step 2: Copy Generation":
     display_copy_generation_instructions()
     
     # Load Claude prompt template
-    with open(claude_prompt_file, "r") as f:
-        claude_prompt = f.read()
+    claude_prompt = load_text_asset(claude_prompt_file)
     
     # Display prompt for Claude
     st.subheader("Claude Prompt")
     st.text_area("Copy this prompt and paste it into Claude:", claude_prompt, height=300)
     
+    # Prompts built from the current matrix, split so each reply stays small
+    if st.session_state.matrix_data is not None:
+        with st.expander("Prompts for Your Matrix"):
+            render_matrix_prompts()
+    
     # Allow direct CSV upload (in case user already has it)
     st.subheader("Upload Copy CSV")
     st.write("If you already have the CSV from Claude, you can upload it here:")
@@ -238,7 +581,7 @@ elif page == "Step 3: Master CSV":
         st.warning("Matrix structure not found. Please complete Step 1 first.")
         if st.button("Go to Step 1"):
             st.session_state.page = "Step 1: Matrix Structure"
-            st.experimental_rerun()
+            st.rerun()
     
     if not copy_ready:
         st.warning("Copy data not found. Please complete Step 2 first.")
@@ -264,24 +607,59 @@ elif page == "Step 3: Master CSV":
     if matrix_ready and copy_ready:
         st.success("All required data is available!")
         
-        if st.button("Generate Master CSV"):
-            # Create a temporary directory for files
-            create_directory_if_not_exists("temp")
-            
-            # Create a temporary file for the copy data
-            temp_csv_path = "temp/temp_copy_data.csv"
-            st.session_state.copy_data.to_csv(temp_csv_path, index=False)
-            
-            # Generate master CSV
-            output_file = f"facebook_ads_master_{datetime.now().strftime('%Y%m%d')}.csv"
-            master_csv = create_master_csv(
-                st.session_state.matrix_data,
-                temp_csv_path,
-                output_file=f"temp/{output_file}"
-            )
+        if "copy_merge_message" in st.session_state:
+            st.success(st.session_state.pop("copy_merge_message"))
+        
+        # Gap-fill prompts for persona-stage combinations without copy
+        missing_copy = find_missing_copy(st.session_state.matrix_data, st.session_state.copy_data)
+        if missing_copy:
+            st.warning(f"Missing copy for {len(missing_copy)} persona-stage combinations; their ads will be skipped.")
+            with st.expander("Fill Missing Copy"):
+                for index, plan in enumerate(plan_copy_prompts(st.session_state.matrix_data, cells=missing_copy), start=1):
+                    st.text_area(f"Gap-fill prompt {index} ({len(plan['cells'])} rows)", plan["prompt"], height=200)
+                
+                with st.form("gap_fill_form"):
+                    returned_csv = st.text_area("Paste the CSV returned by Claude")
+                    merge_rows = st.form_submit_button("Merge Copy Rows")
+                
+                if merge_rows and returned_csv.strip():
+                    try:
+                        new_rows = pd.read_csv(StringIO(returned_csv.strip()))
+                        is_valid, message = validate_csv_format(new_rows, COPY_CSV_COLUMNS)
+                        
+                        if is_valid:
+                            st.session_state.copy_data, added, ignored = merge_copy_data(st.session_state.copy_data, new_rows, cells=missing_copy)
+                            st.session_state.copy_merge_message = f"Added copy for {added} persona-stage combinations"
+                            if ignored:
+                                st.session_state.copy_merge_message += f"; ignored {ignored} rows that repeat a combination or were not asked for"
+                            st.rerun()
+                        else:
+                            st.error(f"Invalid CSV format: {message}")
+                    except Exception as e:
+                        st.error(f"Error loading CSV: {str(e)}")
+        
+        duplicate_mode = st.selectbox(
+            "Duplicate ad copy",
+            ["Keep all ads", "Flag duplicates", "Collapse exact duplicates", "Collapse exact and near duplicates"],
+            help="Ads with identical or nearly identical copy are penalized by ad platforms. Duplicates are flagged across the account but only collapsed within a location group"
+        )
+        
+        master_job = job_manager.latest_job(st.session_state.session_id, "master_csv")
+        
+        if st.button("Generate Master CSV", disabled=master_job is not None and not master_job.done):
+            master_job = start_master_csv_job(duplicate_mode)
+        
+        # Show progress, then results once the background job has finished
+        if display_job_progress(master_job):
+            collect_master_csv_job(master_job)
+            display_missing_copy(master_job)
             
-            # Load the master CSV
-            st.session_state.master_csv = pd.read_csv(master_csv)
+            if master_job.result["duplicate_clusters"] is not None:
+                duplicate_clusters = master_job.result["duplicate_clusters"]
+                st.warning(f"Found {len(duplicate_clusters)} duplicate clusters covering {int(duplicate_clusters['size'].sum())} ads")
+                
+                with st.expander("View duplicate clusters"):
+                    st.dataframe(duplicate_clusters)
             
             st.success(f"Master CSV generated with {len(st.session_state.master_csv)} ad variations!")
             
@@ -294,7 +672,7 @@ elif page == "Step 3: Master CSV":
             st.download_button(
                 label="Download Master CSV",
                 data=csv_data,
-                file_name=output_file,
+                file_name=master_job.label,
                 mime="text/csv"
             )
             
@@ -313,16 +691,28 @@ elif page == "Step 4: Campaign Structure":
     """)
     
     # Check if previous step is completed
-    master_csv_ready = st.session_state.master_csv is not None
+    master_csv_ready = st.session_state.master_csv is not None or st.session_state.master_csv_path is not None
     
     if not master_csv_ready:
         st.warning("Master CSV not found. Please complete Step 3 first.")
         # Allow CSV upload here as well
+        large_file_mode = st.checkbox(
+            "Large master CSV",
+            help="Keep the uploaded file on disk and build the campaign structure in chunks instead of loading it into memory"
+        )
         uploaded_file = st.file_uploader("Upload Master CSV", type=["csv"])
         if uploaded_file is not None:
             try:
-                master_csv = pd.read_csv(uploaded_file)
-                st.session_state.master_csv = master_csv
+                if large_file_mode:
+                    # Copy the upload to the session workspace and only read a preview
+                    master_csv_path = os.path.join(workspace, "uploaded_master_csv.csv")
+                    with open(master_csv_path, "wb") as f:
+                        shutil.copyfileobj(uploaded_file, f)
+                    st.dataframe(pd.read_csv(master_csv_path, nrows=5))
+                    st.session_state.master_csv_path = master_csv_path
+                else:
+                    master_csv = pd.read_csv(uploaded_file)
+                    st.session_state.master_csv = master_csv
                 master_csv_ready = True
                 st.success("Master CSV uploaded successfully!")
             except Exception as e:
@@ -331,36 +721,48 @@ elif page == "Step 4: Campaign Structure":
     if master_csv_ready:
         st.success("Master CSV is available!")
         
-        if st.button("Generate Campaign Structure"):
-            # Create temp directory if it doesn't exist
-            create_directory_if_not_exists("temp")
+        campaign_job = job_manager.latest_job(st.session_state.session_id, "campaign_json")
+        
+        # Ad limits; oversized ad sets and campaigns are split into parts
+        limit_columns = st.columns(2)
+        max_ads_per_ad_set = limit_columns[0].number_input(
+            "Maximum ads per ad set", min_value=1, value=DEFAULT_MAX_ADS_PER_AD_SET, step=1
+        )
+        max_ads_per_campaign = limit_columns[1].number_input(
+            "Maximum ads per campaign (0 for no limit)", min_value=0, value=0, step=100
+        )
+        
+        if st.button("Generate Campaign Structure", disabled=campaign_job is not None and not campaign_job.done):
+            if 0 < max_ads_per_campaign < max_ads_per_ad_set:
+                st.error("Maximum ads per campaign cannot be smaller than maximum ads per ad set")
+            else:
+                campaign_job = start_campaign_job(int(max_ads_per_ad_set), int(max_ads_per_campaign) or None)
+        
+        # Show progress, then results once the background job has finished
+        if display_job_progress(campaign_job):
+            collect_campaign_job(campaign_job)
+            output_file = campaign_job.label
             
-            # Create a temporary file for the master CSV
-            temp_master_csv = "temp/temp_master_csv.csv"
-            st.session_state.master_csv.to_csv(temp_master_csv, index=False)
+            st.success("Facebook campaign structure generated successfully!")
             
-            # Generate campaign structure
-            output_file = f"facebook_campaign_structure_{datetime.now().strftime('%Y%m%d')}.json"
-            campaign_json = generate_facebook_campaign_structure(temp_master_csv, f"temp/{output_file}")
+            packing = campaign_job.result["packing"]
+            if packing and (packing["ad_sets_split"] or packing["campaigns_split"]):
+                st.info(
+                    f"Split {packing['ad_sets_split']} ad sets into {packing['ad_sets_created']} and "
+                    f"{packing['campaigns_split']} campaigns into {packing['campaigns_created']} to respect the ad limits"
+                )
             
-            # Load the campaign JSON
-            with open(campaign_json, "r") as f:
-                st.session_state.campaign_json = json.load(f)
+            # Budget allocation
+            with st.expander("Allocate Daily Budgets"):
+                render_budget_allocation()
             
-            st.success("Facebook campaign structure generated successfully!")
+            # Audience overlap
+            with st.expander("Audience Overlap"):
+                render_overlap_analysis()
             
             # Preview
             st.subheader("Preview")
-            preview_json(st.session_state.campaign_json)
-            
-            # Download option
-            json_data = json.dumps(st.session_state.campaign_json, indent=2)
-            st.download_button(
-                label="Download Campaign Structure (JSON)",
-                data=json_data,
-                file_name=output_file,
-                mime="application/json"
-            )
+            render_campaign_preview(output_file)
             
             # Final instructions
             st.info("""
@@ -388,11 +790,11 @@ elif page == "All-in-One Workflow":
         st.success(f"Matrix structure generated with {len(st.session_state.matrix_data['matrix'])} combinations!")
         
         # Preview
-        preview_df = pd.DataFrame(st.session_state.matrix_data["matrix"][:3])
+        preview_df = pd.DataFrame([cell.to_json() for cell in st.session_state.matrix_data["matrix"][:3]])
         st.dataframe(preview_df)
         
         # Add download button for matrix structure
-        matrix_json = json.dumps(st.session_state.matrix_data, indent=2)
+        matrix_json = json.dumps(matrix_to_json(st.session_state.matrix_data), indent=2)
         st.download_button(
             label="Download Matrix Structure (JSON)",
             data=matrix_json,
@@ -404,8 +806,7 @@ elif page == "All-in-One Workflow":
     st.subheader("Step 2: Copy Data")
     
     # Display Claude prompt from file
-    with open(claude_prompt_file, "r") as f:
-        claude_prompt = f.read()
+    claude_prompt = load_text_asset(claude_prompt_file)
     
     st.write("1. Copy the Claude prompt below and paste it into Claude:")
     st.text_area("Claude Prompt", claude_prompt, height=200)
@@ -433,26 +834,16 @@ elif page == "All-in-One Workflow":
     
     # Steps 3 & 4: Run if ready
     if st.session_state.matrix_data is not None and st.session_state.copy_data is not None:
-        # Create temp directory if it doesn't exist
-        create_directory_if_not_exists("temp")
-        
         # Step 3: Master CSV
         st.subheader("Step 3: Generate Master CSV")
-        if st.button("Generate Master CSV"):
-            # Create a temporary file for the copy data
-            temp_csv_path = "temp/temp_copy_data.csv"
-            st.session_state.copy_data.to_csv(temp_csv_path, index=False)
-            
-            # Generate master CSV
-            output_file = f"facebook_ads_master_{datetime.now().strftime('%Y%m%d')}.csv"
-            master_csv = create_master_csv(
-                st.session_state.matrix_data,
-                temp_csv_path,
-                output_file=f"temp/{output_file}"
-            )
-            
-            # Load the master CSV
-            st.session_state.master_csv = pd.read_csv(master_csv)
+        master_job = job_manager.latest_job(st.session_state.session_id, "master_csv")
+        
+        if st.button("Generate Master CSV", disabled=master_job is not None and not master_job.done):
+            master_job = start_master_csv_job("Keep all ads")
+        
+        if display_job_progress(master_job):
+            collect_master_csv_job(master_job)
+            display_missing_copy(master_job)
             
             st.success(f"Master CSV generated with {len(st.session_state.master_csv)} ad variations!")
             
@@ -464,39 +855,26 @@ elif page == "All-in-One Workflow":
             st.download_button(
                 label="Download Master CSV",
                 data=csv_data,
-                file_name=output_file,
+                file_name=master_job.label,
                 mime="text/csv"
             )
     
     # Step 4: Campaign Structure
     if st.session_state.master_csv is not None:
         st.subheader("Step 4: Generate Campaign Structure")
-        if st.button("Generate Campaign Structure"):
-            # Create a temporary file for the master CSV
-            temp_master_csv = "temp/temp_master_csv.csv"
-            st.session_state.master_csv.to_csv(temp_master_csv, index=False)
-            
-            # Generate campaign structure
-            output_file = f"facebook_campaign_structure_{datetime.now().strftime('%Y%m%d')}.json"
-            campaign_json = generate_facebook_campaign_structure(temp_master_csv, f"temp/{output_file}")
-            
-            # Load the campaign JSON
-            with open(campaign_json, "r") as f:
-                st.session_state.campaign_json = json.load(f)
+        campaign_job = job_manager.latest_job(st.session_state.session_id, "campaign_json")
+        
+        if st.button("Generate Campaign Structure", disabled=campaign_job is not None and not campaign_job.done):
+            campaign_job = start_campaign_job()
+        
+        if display_job_progress(campaign_job):
+            collect_campaign_job(campaign_job)
+            output_file = campaign_job.label
             
             st.success("Facebook campaign structure generated successfully!")
             
             # Preview
-            preview_json(st.session_state.campaign_json)
-            
-            # Download option
-            json_data = json.dumps(st.session_state.campaign_json, indent=2)
-            st.download_button(
-                label="Download Campaign Structure (JSON)",
-                data=json_data,
-                file_name=output_file,
-                mime="application/json"
-            )
+            render_campaign_preview(output_file)
             
             # Final instructions
             st.success("""
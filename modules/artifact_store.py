@@ -0,0 +1,264 @@
+# modules/artifact_store.py
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+# Bump whenever a generator changes its output so stale artifacts are not reused
+GENERATOR_VERSION = "1"
+
+class ArtifactStore:
+    """
+    On-disk store of generated files keyed by a hash of their inputs
+
+    Artifacts are written to a temporary file and atomically renamed into
+    place, so readers never see partial files. The store is shared by every
+    session and process that points at the same directory, and the least
+    recently used artifacts are evicted once it grows past max_bytes.
+
+    Builders hold a lock file and refresh its modification time while they
+    build, so builds may take as long as they need; a lock that has not been
+    refreshed for lock_timeout seconds was left by a crashed builder and is
+    broken.
+    """
+
+    def __init__(self, root="temp/artifacts", max_bytes=2 * 1024**3, lock_timeout=60, eviction_grace=60):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        self.eviction_grace = eviction_grace
+        self.objects_dir = os.path.join(root, "objects")
+        self.locks_dir = os.path.join(root, "locks")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.locks_dir, exist_ok=True)
+
+    def key(self, kind, inputs):
+        """
+        Compute the key of an artifact
+
+        Parameters:
+        - kind: Artifact type, e.g. "master_csv"
+        - inputs: JSON-serializable description of everything the artifact depends on
+
+        Returns:
+        - Hex digest identifying the artifact
+        """
+        payload = json.dumps(
+            {"kind": kind, "version": GENERATOR_VERSION, "inputs": inputs},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        """Return the location of an artifact inside the store"""
+        return os.path.join(self.objects_dir, key[:2], key)
+
+    def get(self, key):
+        """Return the path of a stored artifact, or None if it is not in the store"""
+        path = self.path(key)
+        try:
+            # Record the access for LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, source_path):
+        """
+        Move a finished file into the store
+
+        Parameters:
+        - key: Artifact key from key()
+        - source_path: File to store; it is moved, not copied
+
+        Returns:
+        - Path of the stored artifact
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+        self.evict()
+        return path
+
+    def export(self, path, destination):
+        """
+        Give a stored artifact a second name outside the store
+
+        The artifact is hard linked where possible and copied otherwise, so
+        the exported file survives eviction from the store.
+
+        Returns:
+        - destination
+        """
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            os.link(path, destination)
+        except OSError:
+            shutil.copyfile(path, destination)
+        return destination
+
+    def get_or_build(self, key, build, on_wait=None):
+        """
+        Return an artifact, building it first if needed
+
+        Only one process builds a given artifact at a time; the others wait for
+        it and then reuse the result.
+
+        Parameters:
+        - key: Artifact key from key()
+        - build: Function called as build(path) that writes the artifact to path
+        - on_wait: Function called repeatedly while waiting for another builder (optional, see get_or_build_all)
+
+        Returns:
+        - Path of the stored artifact
+        """
+        paths = self.get_or_build_all({"artifact": key}, lambda temp_paths: build(temp_paths["artifact"]), on_wait=on_wait)
+        return paths["artifact"]
+
+    def get_or_build_all(self, keys, build, on_wait=None):
+        """
+        Return artifacts that are built together, building them first if any is missing
+
+        The artifacts share one lock, so they are always built and stored as a
+        set and a reader never pairs one build's artifact with another's.
+
+        Parameters:
+        - keys: Dictionary of name -> artifact key from key()
+        - build: Function called as build(paths) that writes each artifact to paths[name]
+        - on_wait: Function called repeatedly while another process holds the build lock
+          (optional); an exception it raises stops the wait, e.g. to cancel a job
+
+        Returns:
+        - Dictionary of name -> path of the stored artifact
+        """
+        paths = self._get_all(keys)
+        if paths is not None:
+            return paths
+
+        lock_key = hashlib.sha256("".join(sorted(keys.values())).encode("ascii")).hexdigest()
+        with self._lock(lock_key, on_wait):
+            # Another process may have finished the build while we waited
+            paths = self._get_all(keys)
+            if paths is not None:
+                return paths
+
+            with ExitStack() as stack:
+                temp_paths = {name: stack.enter_context(self._temporary_path(key)) for name, key in keys.items()}
+                build(temp_paths)
+                return {name: self.put(keys[name], temp_paths[name]) for name in keys}
+
+    def evict(self):
+        """Delete least recently used artifacts until the store fits in max_bytes"""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        cutoff = time.time() - self.eviction_grace
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Leave recently used artifacts alone so readers are not cut off
+            if mtime > cutoff:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def _get_all(self, keys):
+        """Return name -> path of the stored artifacts, or None unless all of them are stored"""
+        paths = {name: self.get(key) for name, key in keys.items()}
+        if any(path is None for path in paths.values()):
+            return None
+        return paths
+
+    @contextmanager
+    def _temporary_path(self, key):
+        """Temporary file in the store directory, removed unless it was moved"""
+        directory = os.path.dirname(self.path(key))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = os.path.join(directory, f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            yield temp_path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @contextmanager
+    def _lock(self, key, on_wait=None):
+        """
+        Cross-process lock built on exclusive creation of a lock file
+
+        Waiters wait for as long as the holder keeps refreshing the lock file,
+        calling on_wait between attempts.
+        """
+        lock_path = os.path.join(self.locks_dir, f"{key}.lock")
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    # Break locks left behind by crashed builders
+                    if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if on_wait is not None:
+                    on_wait()
+                time.sleep(0.1)
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._refresh_lock, args=(lock_path, stop), daemon=True)
+        try:
+            os.write(fd, str(os.getpid()).encode("ascii"))
+            os.close(fd)
+            heartbeat.start()
+            yield
+        finally:
+            stop.set()
+            if heartbeat.is_alive():
+                heartbeat.join()
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+    def _refresh_lock(self, lock_path, stop):
+        """Touch a held lock file until stop is set so waiters know the build is alive"""
+        while not stop.wait(self.lock_timeout / 4):
+            try:
+                os.utime(lock_path)
+            except FileNotFoundError:
+                return
+
+def file_digest(path, block_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,157 @@
+# modules/budget.py
+import numpy as np
+import pandas as pd
+
+def build_budget_index(campaigns):
+    """
+    Flatten a campaign structure into arrays for budget allocation
+
+    Every persona x location group of every campaign is one allocation unit.
+    Parts of a split ad set are separate units of the same persona.
+    The index can be reused to re-run compute_budgets() with new weights
+    without walking the campaign structure again.
+
+    Parameters:
+    - campaigns: Dictionary of Campaign objects (see models.campaigns_from_json)
+
+    Returns:
+    - Dictionary with the unit labels and integer codes per dimension
+    """
+    units = []
+    for campaign_key, campaign in campaigns.items():
+        for ad_set_key, ad_set in campaign.ad_sets.items():
+            for location in ad_set.locations:
+                units.append((campaign_key, campaign.objective, ad_set_key, ad_set.persona_id, location))
+
+    table = pd.DataFrame(units, columns=["campaign", "objective", "ad_set", "persona", "location"])
+    index = {"units": table}
+    for column in ["objective", "persona", "location"]:
+        codes, labels = pd.factorize(table[column], sort=False)
+        index[f"{column}_codes"] = codes
+        index[f"{column}_labels"] = list(labels)
+    return index
+
+def compute_budgets(index, total_budget, stage_weights=None, location_priors=None, persona_priors=None, min_budget=0.0, max_budget=None):
+    """
+    Split a total daily budget across allocation units in one vectorized pass
+
+    Each unit's weight is the product of its campaign objective weight and its
+    persona and location priors. Budgets are proportional to the weights,
+    clamped to [min_budget, max_budget] with the clamped amount redistributed
+    over the remaining units, and rounded to cents without changing the total.
+
+    Parameters:
+    - index: Output of build_budget_index()
+    - total_budget: Total daily budget to distribute
+    - stage_weights: Dictionary of campaign objective (see get_campaign_objective) -> weight (optional)
+    - location_priors: Dictionary of location -> weight (optional)
+    - persona_priors: Dictionary of persona_id -> weight (optional)
+    - min_budget: Minimum daily budget per unit
+    - max_budget: Maximum daily budget per unit (optional)
+
+    Returns:
+    - NumPy array with one daily budget per unit
+    """
+    count = len(index["units"])
+    if count == 0:
+        return np.zeros(0)
+
+    max_budget = np.inf if max_budget is None else max_budget
+    if min_budget > max_budget:
+        raise ValueError("min_budget cannot be greater than max_budget")
+    if total_budget < count * min_budget or total_budget > count * max_budget:
+        raise ValueError(
+            f"Total budget {total_budget} cannot be split across {count} ad set locations "
+            f"with a minimum of {min_budget} and a maximum of {max_budget} each"
+        )
+
+    weights = (
+        _lookup(stage_weights, index["objective_labels"], index["objective_codes"])
+        * _lookup(persona_priors, index["persona_labels"], index["persona_codes"])
+        * _lookup(location_priors, index["location_labels"], index["location_codes"])
+    )
+    if (weights < 0).any():
+        raise ValueError("Budget weights and priors must not be negative")
+
+    budgets = np.zeros(count)
+    fixed = np.zeros(count, dtype=bool)
+    while True:
+        free = ~fixed
+        remaining = total_budget - budgets[fixed].sum()
+        free_weights = weights[free]
+        if free_weights.sum() > 0:
+            budgets[free] = remaining * free_weights / free_weights.sum()
+        else:
+            budgets[free] = remaining / free.sum()
+
+        # Fix the side with the larger violation first so the total is preserved
+        below = free & (budgets < min_budget)
+        above = free & (budgets > max_budget)
+        shortfall = (min_budget - budgets[below]).sum()
+        excess = (budgets[above] - max_budget).sum()
+        if shortfall == 0 and excess == 0:
+            break
+        if shortfall >= excess:
+            budgets[below] = min_budget
+            fixed |= below
+        else:
+            budgets[above] = max_budget
+            fixed |= above
+        if fixed.all():
+            break
+
+    return _round_to_cents(budgets, total_budget)
+
+def allocate_budgets(campaigns, total_budget, stage_weights=None, location_priors=None, persona_priors=None, min_budget=0.0, max_budget=None):
+    """
+    Compute daily budgets and write them into the campaign structure
+
+    Each location group gets a daily_budget, and ad sets and campaigns get the
+    sum of their groups.
+
+    Parameters:
+    - campaigns: Dictionary of Campaign objects (modified in place)
+    - Remaining parameters as in compute_budgets()
+
+    Returns:
+    - DataFrame with one row per allocation unit and its daily budget
+    """
+    index = build_budget_index(campaigns)
+    budgets = compute_budgets(
+        index, total_budget, stage_weights=stage_weights, location_priors=location_priors,
+        persona_priors=persona_priors, min_budget=min_budget, max_budget=max_budget
+    )
+    allocation = index["units"].assign(daily_budget=budgets)
+    write_budgets(campaigns, allocation)
+    return allocation
+
+def write_budgets(campaigns, allocation):
+    """Write an allocation table from allocate_budgets() into the Campaign objects"""
+    for campaign in campaigns.values():
+        campaign.daily_budget = 0.0
+        for ad_set in campaign.ad_sets.values():
+            ad_set.daily_budget = 0.0
+
+    for campaign_key, ad_set_key, location, budget in allocation[["campaign", "ad_set", "location", "daily_budget"]].itertuples(index=False, name=None):
+        campaign = campaigns[campaign_key]
+        ad_set = campaign.ad_sets[ad_set_key]
+        ad_set.locations[location].daily_budget = float(budget)
+        ad_set.daily_budget = round(ad_set.daily_budget + budget, 2)
+        campaign.daily_budget = round(campaign.daily_budget + budget, 2)
+
+def _lookup(weights, labels, codes):
+    """Map a label -> weight dictionary onto unit codes, defaulting to 1"""
+    if not weights:
+        return np.ones(len(codes))
+    values = np.array([float(weights.get(label, 1.0)) for label in labels])
+    return values[codes]
+
+def _round_to_cents(budgets, total_budget):
+    """Round budgets down to cents and hand the leftover cents to the largest remainders"""
+    cents = budgets * 100
+    rounded = np.floor(cents + 1e-9)
+    leftover = int(round(total_budget * 100 - rounded.sum()))
+    if leftover > 0:
+        order = np.argsort(-(cents - rounded), kind="stable")
+        rounded[order[:leftover]] += 1
+    return rounded / 100
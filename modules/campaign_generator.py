@@ -1,17 +1,30 @@
 # modules/campaign_generator.py
 import json
 import os
+import tempfile
 import pandas as pd
 from datetime import datetime
 import streamlit as st
+from modules.models import Campaign, AdSet, LocationGroup, Ad, campaigns_to_json
+from modules.packing import pack_campaign_structure, plan_ad_set_parts, split_campaign, part_keys, ad_set_part, location_group_part, validate_ad_limits, check_ad_count
 
-def generate_facebook_campaign_structure(master_csv_file, output_file=None):
+# Default number of master CSV rows read at a time in chunked mode
+DEFAULT_CHUNK_SIZE = 100_000
+
+def generate_facebook_campaign_structure(master_csv_file, output_file=None, progress_callback=None, chunksize=None, spill_dir=None,
+                                         max_ads_per_ad_set=None, max_ads_per_campaign=None, summary_file=None):
     """
     Generate a JSON structure for Facebook ad campaigns based on the master CSV
     
     Parameters:
     - master_csv_file: Path to the master CSV
     - output_file: Path to save the campaign structure JSON (optional)
+    - progress_callback: Function called as progress_callback(fraction, message) (optional)
+    - chunksize: Read the master CSV in blocks of this many rows instead of all at once (optional)
+    - spill_dir: Directory for temporary files in chunked mode (optional)
+    - max_ads_per_ad_set: Pack the structure into this many ads per ad set (optional, see pack_campaign_structure)
+    - max_ads_per_campaign: Maximum number of ads per campaign when packing (optional)
+    - summary_file: Path to save the structure with ad counts instead of ads and the packing report (optional)
     
     Returns:
     - Path to the created JSON file
@@ -19,11 +32,18 @@ def generate_facebook_campaign_structure(master_csv_file, output_file=None):
     if output_file is None:
         output_file = f"facebook_campaign_structure_{datetime.now().strftime('%Y%m%d')}.json"
     
+    if chunksize is not None:
+        return _generate_campaign_structure_chunked(
+            master_csv_file, output_file, chunksize, spill_dir, progress_callback,
+            max_ads_per_ad_set=max_ads_per_ad_set, max_ads_per_campaign=max_ads_per_campaign, summary_file=summary_file
+        )
+    
     # Load master CSV
     df = pd.read_csv(master_csv_file)
     
     # Create campaign structure
     campaigns = {}
+    flag_duplicates = "duplicate_cluster" in df.columns
     
     # Get unique funnel stages, personas, and locations
     funnel_stages = df["funnel_stage"].unique()
@@ -31,12 +51,17 @@ def generate_facebook_campaign_structure(master_csv_file, output_file=None):
     locations = df["location"].unique()
     
     # Group by funnel stage (campaigns)
-    for stage in funnel_stages:
+    total_groups = max(1, len(funnel_stages) * len(personas))
+    for stage_index, stage in enumerate(funnel_stages):
         stage_df = df[df['funnel_stage'] == stage]
         
         # Group by persona (ad sets)
         ad_sets = {}
-        for persona in personas:
+        for persona_index, persona in enumerate(personas):
+            if progress_callback is not None:
+                done_groups = stage_index * len(personas) + persona_index
+                progress_callback(done_groups / total_groups, f"Building ad set {done_groups + 1} of {total_groups}")
+            
             persona_id = persona["persona_id"]
             persona_name = persona["persona_name"]
             persona_df = stage_df[stage_df['persona_id'] == persona_id]
@@ -53,46 +78,363 @@ def generate_facebook_campaign_structure(master_csv_file, output_file=None):
                     continue
                 
                 # List all ads for this combination
-                ads = []
-                for _, row in location_df.iterrows():
-                    ads.append({
-                        "ad_id": row['ad_id'],
-                        "headline": row['headline'],
-                        "description": row['description'],
-                        "cta_text": row['cta_text'],
-                        "image_code": row['image_code'],
-                        "property_type": row['property_type']
-                    })
-                
-                # Add location group if ads exist
-                if ads:
-                    location_groups[location] = {
-                        "name": f"{stage.capitalize()} - {persona_name} - {location}",
-                        "ads": ads
-                    }
+                ads = [_build_ad(row, flag_duplicates) for _, row in location_df.iterrows()]
+                location_groups[location] = LocationGroup(location, f"{stage.capitalize()} - {persona_name} - {location}", ads)
             
             # Add persona group if locations exist
             if location_groups:
-                ad_sets[persona_id] = {
-                    "name": f"{stage.capitalize()} - {persona_name}",
-                    "targeting": get_targeting_params(persona_id),
-                    "locations": location_groups
-                }
+                ad_sets[persona_id] = AdSet(persona_id, f"{stage.capitalize()} - {persona_name}", get_targeting_params(persona_id), location_groups)
         
         # Add stage campaign if ad sets exist
         if ad_sets:
-            campaigns[stage] = {
-                "name": f"Property Valuation - {stage.capitalize()}",
-                "objective": get_campaign_objective(stage),
-                "ad_sets": ad_sets
-            }
+            campaigns[stage] = Campaign(stage, f"Property Valuation - {stage.capitalize()}", get_campaign_objective(stage), ad_sets)
     
-    # Export campaign structure as JSON
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(campaigns, f, indent=2, ensure_ascii=False)
+    # Pack into the ad limits
+    report = None
+    if max_ads_per_ad_set is not None:
+        campaigns, report = pack_campaign_structure(campaigns, max_ads_per_ad_set=max_ads_per_ad_set, max_ads_per_campaign=max_ads_per_campaign)
+    
+    # Export campaign structure as JSON, one ad at a time
+    _write_campaigns(output_file, campaigns, lambda ad_set, location: (
+        _indent_json(ad.to_json(), 7) for ad in ad_set.locations[location].ads
+    ))
+    
+    if summary_file is not None:
+        _write_summary(summary_file, campaigns, report)
+    
+    return output_file
+
+def _build_ad(row, flag_duplicates):
+    """Convert a master CSV row into an Ad"""
+    # Carry duplicate flags from detect_duplicate_ads() into the ad
+    if flag_duplicates and row['duplicate_cluster'] >= 0:
+        return Ad(
+            row['ad_id'], row['headline'], row['description'], row['cta_text'], row['image_code'], row['property_type'],
+            int(row['duplicate_cluster']), row['duplicate_type'], bool(row['duplicate_primary'])
+        )
+    return Ad(row['ad_id'], row['headline'], row['description'], row['cta_text'], row['image_code'], row['property_type'])
+
+def _generate_campaign_structure_chunked(master_csv_file, output_file, chunksize, spill_dir, progress_callback,
+                                         max_ads_per_ad_set=None, max_ads_per_campaign=None, summary_file=None):
+    """
+    Build the campaign structure JSON without loading the whole master CSV
+    
+    The master CSV is read in blocks of `chunksize` rows. Ads are appended to one
+    spill file per stage/persona/location group while ads are counted per
+    property type. Packing into the ad limits is planned from those counts, and
+    the JSON is streamed out group by group in the same order and format as the
+    in-memory build, so peak memory depends on the chunk size rather than on the
+    size of the master CSV.
+    """
+    if max_ads_per_ad_set is not None:
+        validate_ad_limits(max_ads_per_ad_set, max_ads_per_campaign)
+    else:
+        max_ads_per_campaign = None
+    
+    # First-appearance order of stages, persona id/name pairs and locations
+    funnel_stages = {}
+    personas = {}
+    locations = {}
+    group_files = {}
+    # Ads per property type of each group, in first-appearance order
+    property_counts = {}
+    
+    total_bytes = max(1, os.path.getsize(master_csv_file))
+    
+    with tempfile.TemporaryDirectory(dir=spill_dir) as spill_path:
+        with open(master_csv_file, "rb") as source:
+            for chunk_index, chunk in enumerate(pd.read_csv(source, chunksize=chunksize)):
+                if progress_callback is not None:
+                    progress_callback(0.8 * min(source.tell() / total_bytes, 1.0), f"Reading master CSV block {chunk_index + 1}")
+                
+                flag_duplicates = "duplicate_cluster" in chunk.columns
+                funnel_stages.update(dict.fromkeys(chunk["funnel_stage"].unique()))
+                personas.update(dict.fromkeys(chunk[["persona_id", "persona_name"]].drop_duplicates().itertuples(index=False, name=None)))
+                locations.update(dict.fromkeys(chunk["location"].unique()))
+                
+                # Append this block's ads to their group spill files, keeping row order
+                for key, group_df in chunk.groupby(["funnel_stage", "persona_id", "location"], sort=False):
+                    if key not in group_files:
+                        group_files[key] = os.path.join(spill_path, f"group_{len(group_files)}.jsonl")
+                        property_counts[key] = {}
+                    with open(group_files[key], "a", encoding="utf-8") as spill:
+                        for _, row in group_df.iterrows():
+                            spill.write(json.dumps(_build_ad(row, flag_duplicates).to_json(), ensure_ascii=False))
+                            spill.write("\n")
+                    counts = property_counts[key]
+                    for property_type, count in group_df["property_type"].value_counts(sort=False).items():
+                        counts[property_type] = counts.get(property_type, 0) + int(count)
+        
+        # Ad sets keep the position of the first name seen for a persona id but,
+        # like the in-memory build, use the last one
+        persona_names = {}
+        for persona_id, persona_name in personas:
+            persona_names[persona_id] = persona_name
+        
+        stage_keys = {key[0] for key in group_files}
+        ad_set_keys = {key[:2] for key in group_files}
+        property_files = {}
+        
+        def piece_lines(stage, persona_id, piece):
+            """Yield the spilled ads of one planned piece of a location group"""
+            location, property_type, start, stop = piece
+            group_file = group_files[(stage, persona_id, location)]
+            if property_type is None:
+                with open(group_file, "r", encoding="utf-8") as spill:
+                    yield from spill
+                return
+            
+            # Split groups are spilled again per property type once, remembering
+            # where every max_ads_per_ad_set-th ad starts so chunks can seek to it
+            if group_file not in property_files:
+                property_files[group_file] = _spill_by_property(group_file, max_ads_per_ad_set)
+            path, offsets = property_files[group_file][property_type]
+            with open(path, "rb") as spill:
+                spill.seek(offsets[start // max_ads_per_ad_set])
+                for _ in range(stop - start):
+                    yield spill.readline()
+        
+        report = None
+        if max_ads_per_ad_set is not None:
+            report = {"ad_sets_split": 0, "ad_sets_created": 0, "campaigns_split": 0, "campaigns_created": 0}
+        summary = {}
+        written_ads = 0
+        
+        with open(output_file, 'w', encoding='utf-8') as f:
+            campaign_keys = [stage for stage in funnel_stages if stage in stage_keys]
+            taken_campaign_keys = set(campaign_keys)
+            f.write("{" if campaign_keys else "{}")
+            
+            for stage_index, stage in enumerate(campaign_keys):
+                if progress_callback is not None:
+                    progress_callback(0.8 + 0.2 * stage_index / len(campaign_keys), f"Writing campaign {stage_index + 1} of {len(campaign_keys)}")
+                
+                # Plan the stage's ad sets from the counts; pieces say where each location group's ads come from
+                ad_sets = {}
+                pieces = {}
+                persona_ids = [persona_id for persona_id in persona_names if (stage, persona_id) in ad_set_keys]
+                taken_ad_set_keys = set(persona_ids)
+                for persona_id in persona_ids:
+                    persona_name = persona_names[persona_id]
+                    location_sizes = [
+                        (location, list(property_counts[(stage, persona_id, location)].items()))
+                        for location in locations if (stage, persona_id, location) in group_files
+                    ]
+                    ad_set = AdSet(persona_id, f"{stage.capitalize()} - {persona_name}", get_targeting_params(persona_id), {
+                        location: LocationGroup(
+                            location, f"{stage.capitalize()} - {persona_name} - {location}", None,
+                            ad_count=sum(count for _, count in property_sizes)
+                        )
+                        for location, property_sizes in location_sizes
+                    })
+                    
+                    if max_ads_per_ad_set is None or ad_set.ad_count <= max_ads_per_ad_set:
+                        ad_sets[persona_id] = ad_set
+                        for location, group in ad_set.locations.items():
+                            pieces[(persona_id, location)] = [(location, None, 0, group.ad_count)]
+                        continue
+                    
+                    parts = plan_ad_set_parts(location_sizes, max_ads_per_ad_set)
+                    report["ad_sets_split"] += 1
+                    report["ad_sets_created"] += len(parts)
+                    keys = part_keys(persona_id, len(parts), taken_ad_set_keys)
+                    for index, (key, part_pieces) in enumerate(zip(keys, parts), start=1):
+                        location_pieces = {}
+                        for piece in part_pieces:
+                            location_pieces.setdefault(piece[0], []).append(piece)
+                        part = ad_set_part(ad_set, key, index, {
+                            location: location_group_part(
+                                ad_set.locations[location], index, None,
+                                ad_count=sum(stop - start for _, _, start, stop in group_pieces)
+                            )
+                            for location, group_pieces in location_pieces.items()
+                        })
+                        ad_sets[part.key] = part
+                        for location, group_pieces in location_pieces.items():
+                            pieces[(part.key, location)] = group_pieces
+                
+                campaign = Campaign(stage, f"Property Valuation - {stage.capitalize()}", get_campaign_objective(stage), ad_sets)
+                campaign_parts = split_campaign(campaign, max_ads_per_campaign, taken_campaign_keys)
+                if len(campaign_parts) > 1:
+                    report["campaigns_split"] += 1
+                    report["campaigns_created"] += len(campaign_parts)
+                
+                for campaign in campaign_parts:
+                    f.write("," if summary else "")
+                    summary[campaign.key] = campaign
+                    written_ads += _write_campaign(f, campaign, lambda ad_set, location: (
+                        _indent_json(json.loads(line), 7)
+                        for piece in pieces[(ad_set.key, location)]
+                        for line in piece_lines(stage, ad_set.persona_id, piece)
+                    ))
+            
+            if campaign_keys:
+                f.write("\n}")
+        
+        # Every spilled ad must be planned into the summary and written exactly once
+        spilled_ads = sum(sum(counts.values()) for counts in property_counts.values())
+        check_ad_count(spilled_ads, sum(campaign.ad_count for campaign in summary.values()))
+        check_ad_count(spilled_ads, written_ads)
+    
+    if summary_file is not None:
+        _write_summary(summary_file, summary, report)
+    
+    return output_file
+
+def _spill_by_property(group_file, block_size):
+    """
+    Split a group spill file into one file per property type
+    
+    Returns:
+    - Dictionary of property type -> (path, byte offset of every block_size-th line)
+    """
+    files = {}
+    counts = {}
+    handles = {}
+    try:
+        with open(group_file, "rb") as spill:
+            for line in spill:
+                property_type = json.loads(line)["property_type"]
+                if property_type not in files:
+                    path = f"{group_file}.{len(files)}"
+                    files[property_type] = (path, [])
+                    counts[property_type] = 0
+                    handles[property_type] = open(path, "wb")
+                handle = handles[property_type]
+                if counts[property_type] % block_size == 0:
+                    files[property_type][1].append(handle.tell())
+                handle.write(line)
+                counts[property_type] += 1
+    finally:
+        for handle in handles.values():
+            handle.close()
+    return files
+
+def write_campaign_budgets(campaign_json_file, campaigns, output_file):
+    """
+    Copy a campaign structure JSON with the budgets of its Campaign objects written in
+    
+    This is how structures that stay on disk get their budgets: campaigns is
+    the summary loaded without ads, with budgets set by budget.allocate_budgets(),
+    and the ads are copied over line by line, so memory does not grow with the
+    size of the file.
+    
+    Parameters:
+    - campaign_json_file: Campaign structure JSON written by generate_facebook_campaign_structure()
+    - campaigns: Dictionary of Campaign objects matching that file, with ad counts instead of ads
+    - output_file: Path to save the budgeted copy
     
+    Returns:
+    - Path to the created JSON file
+    """
+    with open(campaign_json_file, "r", encoding="utf-8") as source:
+        def group_ads(ad_set, location):
+            """Yield the ads of the next location group in the source file"""
+            # The writer puts every ads array and every ad on lines of their own at fixed indentation
+            for line in source:
+                if line == '            "ads": [\n':
+                    break
+            ad_lines = []
+            for line in source:
+                if line.startswith("            ]"):
+                    break
+                if line.startswith("              {") and ad_lines:
+                    yield _source_ad(ad_lines)
+                    ad_lines = []
+                ad_lines.append(line)
+            if ad_lines:
+                yield _source_ad(ad_lines)
+        
+        written_ads = _write_campaigns(output_file, campaigns, group_ads)
+    
+    check_ad_count(sum(campaign.ad_count for campaign in campaigns.values()), written_ads)
     return output_file
 
+def _source_ad(lines):
+    """Ad text as _write_campaign() expects it from the lines the writer produced for one ad"""
+    return "".join(lines).strip().rstrip(",")
+
+def _write_campaigns(output_file, campaigns, ads):
+    """
+    Write Campaign objects to output_file exactly as json.dump(indent=2) would write their JSON
+    
+    Returns:
+    - Number of ads written
+    """
+    written_ads = 0
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write("{" if campaigns else "{}")
+        for campaign_index, campaign in enumerate(campaigns.values()):
+            f.write("," if campaign_index else "")
+            written_ads += _write_campaign(f, campaign, ads)
+        if campaigns:
+            f.write("\n}")
+    return written_ads
+
+def _write_campaign(f, campaign, ads):
+    """
+    Stream one campaign into a JSON object being written with json.dump(indent=2) formatting
+    
+    Parameters:
+    - f: Output file positioned after the previous campaign (or the opening brace)
+    - campaign: Campaign to write; its location groups may hold ad counts instead of ads
+    - ads: Function called as ads(ad_set, location) yielding the group's ads serialized
+      with _indent_json(ad, 7)
+    
+    Returns:
+    - Number of ads written
+    """
+    ad_count = 0
+    f.write(f"\n  {json.dumps(campaign.key, ensure_ascii=False)}: {{")
+    f.write(f"\n    \"name\": {json.dumps(campaign.name, ensure_ascii=False)},")
+    f.write(f"\n    \"objective\": {json.dumps(campaign.objective, ensure_ascii=False)},")
+    f.write("\n    \"ad_sets\": {")
+    
+    for ad_set_index, ad_set in enumerate(campaign.ad_sets.values()):
+        f.write("," if ad_set_index else "")
+        f.write(f"\n      {json.dumps(ad_set.key, ensure_ascii=False)}: {{")
+        f.write(f"\n        \"name\": {json.dumps(ad_set.name, ensure_ascii=False)},")
+        if ad_set.persona_id != ad_set.key:
+            f.write(f"\n        \"persona_id\": {json.dumps(ad_set.persona_id, ensure_ascii=False)},")
+        f.write(f"\n        \"targeting\": {_indent_json(ad_set.targeting, 4)},")
+        f.write("\n        \"locations\": {")
+        
+        for location_index, (location, group) in enumerate(ad_set.locations.items()):
+            f.write("," if location_index else "")
+            f.write(f"\n          {json.dumps(location, ensure_ascii=False)}: {{")
+            f.write(f"\n            \"name\": {json.dumps(group.name, ensure_ascii=False)},")
+            f.write("\n            \"ads\": [")
+            
+            for ad_index, ad in enumerate(ads(ad_set, location)):
+                f.write("," if ad_index else "")
+                f.write(f"\n              {ad}")
+                ad_count += 1
+            
+            f.write("\n            ]")
+            _write_budget(f, group.daily_budget, 6)
+            f.write("\n          }")
+        f.write("\n        }")
+        _write_budget(f, ad_set.daily_budget, 4)
+        f.write("\n      }")
+    f.write("\n    }")
+    _write_budget(f, campaign.daily_budget, 2)
+    f.write("\n  }")
+    return ad_count
+
+def _write_budget(f, daily_budget, level):
+    """Write the daily_budget member of an object whose members are at the given nesting level, if it has one"""
+    if daily_budget is not None:
+        f.write(f",\n{'  ' * level}\"daily_budget\": {json.dumps(daily_budget)}")
+
+def _write_summary(summary_file, campaigns, packing):
+    """Write the structure of the campaigns with ad counts instead of ads, plus the packing report"""
+    with open(summary_file, "w", encoding="utf-8") as f:
+        json.dump({"campaigns": campaigns_to_json(campaigns, include_ads=False), "packing": packing}, f, ensure_ascii=False)
+
+def _indent_json(value, level):
+    """Serialize a value the way json.dump(indent=2) would at the given nesting level"""
+    return json.dumps(value, indent=2, ensure_ascii=False).replace("\n", "\n" + "  " * level)
+
 def get_targeting_params(persona_id):
     """Generate targeting parameters based on persona"""
     targeting = {
@@ -1,5 +1,11 @@
 # modules/copy_generator.py
 import streamlit as st
+import pandas as pd
+
+COPY_CSV_COLUMNS = ["persona_id", "funnel_stage", "headline", "description", "cta_text"]
+
+# Rows per prompt; about 250 characters each, well inside a single response
+DEFAULT_MAX_ROWS_PER_PROMPT = 24
 
 def get_claude_prompt():
     """
@@ -80,6 +86,174 @@ Personas and Stages:
 Make the copy emotionally resonant, targeted, and compelling. Each ad should clearly speak to the specific persona's situation, fears, and desires at their particular funnel stage.
 """
 
+def required_copy_cells(matrix_data):
+    """
+    List the persona/funnel stage combinations the matrix needs copy for
+
+    Parameters:
+    - matrix_data: Output from define_matrix_structure()
+
+    Returns:
+    - List of (persona_id, funnel_stage) tuples in matrix order
+    """
+    return list(dict.fromkeys((cell.persona_id, cell.funnel_stage) for cell in matrix_data["matrix"]))
+
+def find_missing_copy(matrix_data, copy_df):
+    """
+    Find the persona/funnel stage combinations that have no copy yet
+
+    Parameters:
+    - matrix_data: Output from define_matrix_structure()
+    - copy_df: DataFrame with copy variations (may be None)
+
+    Returns:
+    - List of (persona_id, funnel_stage) tuples in matrix order
+    """
+    covered = set()
+    if copy_df is not None and not copy_df.empty:
+        covered = set(zip(copy_df["persona_id"], copy_df["funnel_stage"]))
+    return [cell for cell in required_copy_cells(matrix_data) if cell not in covered]
+
+def plan_copy_prompts(matrix_data, cells=None, max_rows_per_prompt=DEFAULT_MAX_ROWS_PER_PROMPT):
+    """
+    Build copy prompts for the current matrix, split into size-bounded batches
+
+    Cells are grouped by persona so each prompt only describes the personas
+    it asks about, and a persona is only split across prompts when it alone
+    has more stages than fit in one.
+
+    Parameters:
+    - matrix_data: Output from define_matrix_structure()
+    - cells: (persona_id, funnel_stage) tuples to ask for (optional, defaults to every cell in the matrix)
+    - max_rows_per_prompt: Maximum number of CSV rows requested by one prompt
+
+    Returns:
+    - List of dictionaries with the prompt text and the cells it covers
+    """
+    if max_rows_per_prompt < 1:
+        raise ValueError("max_rows_per_prompt must be at least 1")
+    if cells is None:
+        cells = required_copy_cells(matrix_data)
+
+    by_persona = {}
+    for persona_id, funnel_stage in cells:
+        by_persona.setdefault(persona_id, []).append((persona_id, funnel_stage))
+
+    # Fill batches persona by persona, starting a new batch when the next persona does not fit
+    batches = []
+    batch = []
+    for persona_cells in by_persona.values():
+        if batch and len(batch) + len(persona_cells) > max_rows_per_prompt:
+            batches.append(batch)
+            batch = []
+        for cell in persona_cells:
+            if len(batch) == max_rows_per_prompt:
+                batches.append(batch)
+                batch = []
+            batch.append(cell)
+    if batch:
+        batches.append(batch)
+
+    personas = {persona["id"]: persona for persona in matrix_data["personas"]}
+    funnel_stages = {stage["id"]: stage for stage in matrix_data["funnel_stages"]}
+    return [
+        {"cells": batch, "prompt": build_copy_prompt(batch, personas, funnel_stages)}
+        for batch in batches
+    ]
+
+def build_copy_prompt(cells, personas, funnel_stages):
+    """
+    Build a prompt asking for one row of copy per persona/funnel stage combination
+
+    Parameters:
+    - cells: List of (persona_id, funnel_stage) tuples
+    - personas: Dictionary of persona id -> persona dictionary
+    - funnel_stages: Dictionary of funnel stage id -> funnel stage dictionary
+
+    Returns:
+    - Prompt text
+    """
+    persona_lines = []
+    for persona_id in dict.fromkeys(persona_id for persona_id, _ in cells):
+        persona = personas.get(persona_id, {})
+        details = ", ".join(
+            str(persona[key]) for key in ["name", "age", "situation"] if persona.get(key)
+        )
+        persona_lines.append(f"- {persona_id}: {details}" if details else f"- {persona_id}")
+
+    stage_lines = []
+    for funnel_stage in dict.fromkeys(funnel_stage for _, funnel_stage in cells):
+        stage = funnel_stages.get(funnel_stage, {})
+        details = ", ".join(
+            f"{key.replace('_', ' ')}: {stage[key]}" for key in ["intent", "cta_type"] if stage.get(key)
+        )
+        stage_lines.append(f"- {funnel_stage}: {details}" if details else f"- {funnel_stage}")
+
+    row_lines = [f'- "{persona_id}","{funnel_stage}"' for persona_id, funnel_stage in cells]
+
+    return f"""Please create {len(cells)} variations of Facebook ad copy for a property valuation tool in CSV format, one for each persona and funnel stage combination listed below.
+
+Personas:
+{chr(10).join(persona_lines)}
+
+Funnel stages:
+{chr(10).join(stage_lines)}
+
+Ad Copy Requirements and CSV Format Instructions
+
+1. Your response must begin with "{','.join(COPY_CSV_COLUMNS)}" as the header row
+2. Each subsequent row must contain exactly 5 fields in the specified order
+3. ALL text fields must be enclosed in double quotes (")
+4. Do NOT use commas in headlines at all
+5. If commas are needed in descriptions or CTAs, ensure the entire text is properly enclosed in quotes
+6. Keep headlines under 40 characters
+7. Keep descriptions under 125 characters
+8. Use Spanish text with property placeholders like {{property_type}} and {{location}} where appropriate
+
+CSV Formatting Rules:
+- Begin with the header row
+- Provide exactly {len(cells)} rows of data, one for each of these persona_id/funnel_stage combinations:
+{chr(10).join(row_lines)}
+- Ensure ALL fields are properly quoted with double quotes
+- Check that no unescaped quotes appear in the text
+- Format as plain text CSV with no markdown or other formatting
+- Each line should follow this exact format: "persona_id","funnel_stage","headline","description","cta_text"
+
+Make the copy emotionally resonant, targeted, and compelling. Each ad should clearly speak to the specific persona's situation, fears, and desires at their particular funnel stage.
+"""
+
+def merge_copy_data(copy_df, new_rows, cells=None):
+    """
+    Merge returned copy rows into existing copy data
+
+    Existing rows win, so only combinations without copy are filled in.
+
+    Parameters:
+    - copy_df: Existing copy DataFrame (may be None)
+    - new_rows: DataFrame with the returned rows
+    - cells: (persona_id, funnel_stage) tuples that were asked for (optional); rows
+      for any other combination are ignored
+
+    Returns:
+    - Tuple of (merged DataFrame, number of combinations added, number of returned rows ignored)
+    """
+    new_rows = new_rows[COPY_CSV_COLUMNS].dropna(subset=COPY_CSV_COLUMNS)
+    if copy_df is None:
+        copy_df = pd.DataFrame(columns=COPY_CSV_COLUMNS)
+    requested = None if cells is None else set(cells)
+
+    # Keep the first returned row for each requested combination that has no copy yet
+    seen = set(zip(copy_df["persona_id"], copy_df["funnel_stage"]))
+    keep = []
+    for cell in zip(new_rows["persona_id"], new_rows["funnel_stage"]):
+        keep.append(cell not in seen and (requested is None or cell in requested))
+        seen.add(cell)
+    ignored = len(new_rows) - sum(keep)
+    new_rows = new_rows[keep]
+
+    merged = pd.concat([copy_df, new_rows], ignore_index=True)
+    return merged, len(new_rows), ignored
+
 def display_copy_generation_instructions():
     """
     Displays instructions for generating copy with Claude
@@ -2,16 +2,19 @@
 import pandas as pd
 import os
 from datetime import datetime
-import streamlit as st
 
-def create_master_csv(matrix_data, copy_data_csv, output_file=None):
+def create_master_csv(matrix_data, copy_data_csv, output_file=None, progress_callback=None):
     """
     Create a master CSV by combining the matrix structure with copy data
     
+    Matrix cells whose persona and funnel stage have no copy are skipped;
+    copy_generator.find_missing_copy() lists them.
+    
     Parameters:
     - matrix_data: Output from define_matrix_structure()
     - copy_data_csv: Path to CSV with copy variations from Claude
     - output_file: Path to save the master CSV (optional)
+    - progress_callback: Function called as progress_callback(fraction, message) (optional)
     
     Returns:
     - Path to the created CSV file
@@ -27,47 +30,44 @@ def create_master_csv(matrix_data, copy_data_csv, output_file=None):
     rows = []
     ad_id = 1
     
-    # Track missing combinations for reporting
-    missing_combinations = []
+    # First copy row per persona/stage combination
+    copy_lookup = {}
+    for copy_row in copy_df.to_dict("records"):
+        copy_lookup.setdefault((copy_row["persona_id"], copy_row["funnel_stage"]), copy_row)
+    
+    total = len(matrix_data["matrix"])
+    report_every = max(1, total // 100)
     
-    for item in matrix_data["matrix"]:
+    for index, item in enumerate(matrix_data["matrix"]):
+        if progress_callback is not None and index % report_every == 0:
+            progress_callback(index / total, f"Building ad {index + 1} of {total}")
+        
         # Find matching copy
-        copy_match = copy_df[(copy_df["persona_id"] == item["persona_id"]) & 
-                            (copy_df["funnel_stage"] == item["funnel_stage"])]
+        copy_row = copy_lookup.get((item.persona_id, item.funnel_stage))
         
-        if not copy_match.empty:
-            copy_row = copy_match.iloc[0]
-            
+        if copy_row is not None:
             # Replace placeholders in copy
-            headline = copy_row["headline"].replace("{property_type}", item["property_type"]).replace("{location}", item["location"])
-            description = copy_row["description"].replace("{property_type}", item["property_type"]).replace("{location}", item["location"])
+            headline = copy_row["headline"].replace("{property_type}", item.property_type).replace("{location}", item.location)
+            description = copy_row["description"].replace("{property_type}", item.property_type).replace("{location}", item.location)
             
             # Add row to master CSV
             rows.append({
                 "ad_id": f"AD{ad_id:04d}",
-                "persona_id": item["persona_id"],
-                "persona_name": item["persona_name"],
-                "funnel_stage": item["funnel_stage"],
-                "property_type": item["property_type"],
-                "location": item["location"],
+                "persona_id": item.persona_id,
+                "persona_name": item.persona_name,
+                "funnel_stage": item.funnel_stage,
+                "property_type": item.property_type,
+                "location": item.location,
                 "headline": headline,
                 "description": description,
                 "cta_text": copy_row["cta_text"],
-                "image_code": f"{item['persona_id']}_{item['funnel_stage']}_1"
+                "image_code": f"{item.persona_id}_{item.funnel_stage}_1"
             })
             ad_id += 1
-        else:
-            # Record missing combination
-            missing_combinations.append(f"{item['persona_id']}_{item['funnel_stage']}")
     
     # Create DataFrame and save to CSV
     df = pd.DataFrame(rows)
     df.to_csv(output_file, index=False)
     
-    # Report missing combinations if any
-    if missing_combinations:
-        unique_missing = list(set(missing_combinations))
-        st.warning(f"Missing copy for {len(unique_missing)} persona-stage combinations: {', '.join(unique_missing)}")
-    
     print(f"Generated master CSV with {len(rows)} ad variations: {output_file}")
     return output_file
\ No newline at end of file
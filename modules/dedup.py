@@ -0,0 +1,282 @@
+# modules/dedup.py
+import numpy as np
+import pandas as pd
+
+COPY_COLUMNS = ["headline", "description", "cta_text"]
+DUPLICATE_COLUMNS = ["duplicate_cluster", "duplicate_type", "duplicate_primary"]
+CLUSTER_COLUMNS = ["duplicate_cluster", "duplicate_type", "size", "primary_ad_id", "headline", "ad_ids"]
+
+# Ads are only collapsed against other ads of the same location group
+COLLAPSE_GROUP_COLUMNS = ["funnel_stage", "persona_id", "location"]
+
+def detect_duplicate_ads(master_df, near_duplicates=True, threshold=0.8, num_perm=128, bands=16, shingle_size=4, progress_callback=None):
+    """
+    Find ads with exact and near-duplicate copy in a master dataset
+
+    Exact duplicates are found by hashing the rendered copy in a single pass,
+    linear in the number of rows. Near duplicates are found with
+    one-permutation MinHash signatures and LSH banding, computed only once per
+    distinct copy text: hashing is linear in the characters of the distinct
+    texts, bucketing sorts them once per band (O(bands * U log U) for U
+    distinct texts), and at most bands * U candidate pairs are compared, so
+    the cost depends on the number of unique texts rather than the number of
+    rows.
+
+    Parameters:
+    - master_df: DataFrame with the master CSV columns
+    - near_duplicates: Whether to also look for near duplicates (default True)
+    - threshold: Minimum estimated Jaccard similarity for near duplicates. Each
+      member of an LSH bucket is only compared with the bucket's first member,
+      so two texts that are similar to each other but not to that member are
+      missed in that band; they are still found if another band puts them in a
+      bucket together, or if both reach the threshold against the first member.
+      This trades some recall for a linear number of comparisons
+    - num_perm: Number of MinHash permutations
+    - bands: Number of LSH bands (must divide num_perm)
+    - shingle_size: Character shingle length used for MinHash
+    - progress_callback: Function called as progress_callback(fraction, message) between
+      phases and blocks of work (optional); an exception it raises stops the detection
+
+    Returns:
+    - Tuple of (annotated DataFrame, clusters DataFrame)
+    """
+    if num_perm % bands != 0:
+        raise ValueError("num_perm must be divisible by bands")
+    report = progress_callback if progress_callback is not None else lambda fraction, message=None: None
+
+    df = master_df.drop(columns=[col for col in DUPLICATE_COLUMNS if col in master_df.columns])
+
+    # Exact duplicates
+    report(0.0, "Finding exact duplicate copy...")
+    text_codes, unique_texts = _exact_text_codes(df)
+
+    # Near duplicates: cluster the unique texts
+    if near_duplicates and len(unique_texts) > 1:
+        text_cluster = _cluster_near_duplicates(list(unique_texts), threshold, num_perm, bands, shingle_size, report)
+    else:
+        text_cluster = np.arange(len(unique_texts))
+
+    row_cluster = text_cluster[text_codes]
+    rows_per_cluster = np.bincount(row_cluster, minlength=len(unique_texts))
+    texts_per_cluster = np.bincount(text_cluster, minlength=len(unique_texts))
+
+    is_duplicate = rows_per_cluster[row_cluster] > 1
+    is_near = texts_per_cluster[row_cluster] > 1
+
+    # Renumber clusters densely in order of first appearance
+    _, first_rows, cluster_ids = np.unique(row_cluster, return_index=True, return_inverse=True)
+    order = np.argsort(first_rows)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    cluster_ids = rank[cluster_ids.ravel()]
+    primary = np.zeros(len(df), dtype=bool)
+    primary[first_rows] = True
+
+    df["duplicate_cluster"] = np.where(is_duplicate, cluster_ids, -1)
+    df["duplicate_type"] = np.where(is_near, "near", np.where(is_duplicate, "exact", ""))
+    df["duplicate_primary"] = primary | ~is_duplicate
+
+    report(0.95, "Summarizing duplicate clusters...")
+    clusters = _summarize_clusters(df)
+    return df, clusters
+
+def collapse_duplicate_ads(annotated_df, include_near=False, group_columns=None):
+    """
+    Drop redundant duplicate ads within each location group
+
+    Only ads of the same campaign, ad set and location compete with each other,
+    so the first ad of each duplicate set is kept per location group. This
+    never empties a location group, and copy that differs only by its
+    {location} placeholder is never collapsed.
+
+    Parameters:
+    - annotated_df: DataFrame returned by detect_duplicate_ads()
+    - include_near: Also collapse near duplicates (default False, exact copy only)
+    - group_columns: Columns defining a location group (optional, defaults to COLLAPSE_GROUP_COLUMNS)
+
+    Returns:
+    - DataFrame without the redundant ads
+    """
+    if group_columns is None:
+        group_columns = COLLAPSE_GROUP_COLUMNS
+    group_columns = [col for col in group_columns if col in annotated_df.columns]
+
+    is_duplicate = annotated_df["duplicate_cluster"].to_numpy() >= 0
+    if include_near:
+        duplicate_key = annotated_df["duplicate_cluster"].to_numpy()
+    else:
+        duplicate_key, _ = _exact_text_codes(annotated_df)
+
+    keys = annotated_df[group_columns].assign(_duplicate_key=duplicate_key)
+    redundant = is_duplicate & keys.duplicated().to_numpy()
+    return annotated_df[~redundant].reset_index(drop=True)
+
+def _exact_text_codes(df):
+    """
+    Assign one code per distinct normalized copy text
+
+    Each copy column is factorized and the integer codes are combined into one
+    key per row, so only the unique texts are built and normalized.
+
+    Returns:
+    - Tuple of (code per row, unique normalized texts)
+    """
+    raw_codes = np.zeros(len(df), dtype=np.int64)
+    column_uniques = []
+    for col in COPY_COLUMNS:
+        codes, uniques = pd.factorize(df[col].fillna("").astype(str), sort=False)
+        raw_codes, _ = pd.factorize(raw_codes * len(uniques) + codes, sort=False)
+        column_uniques.append((codes, uniques))
+    _, first_of_text = np.unique(raw_codes, return_index=True)
+    raw_uniques = [
+        "\x1f".join(uniques[codes[row]] for codes, uniques in column_uniques)
+        for row in first_of_text
+    ]
+    normalized = pd.Series([" ".join(text.casefold().split()) for text in raw_uniques], dtype=object)
+    unique_codes, unique_texts = pd.factorize(normalized, sort=False)
+    return unique_codes[raw_codes], unique_texts
+
+def _summarize_clusters(df):
+    """Build one row per duplicate cluster"""
+    id_column = "ad_id" if "ad_id" in df.columns else None
+    columns = ["duplicate_cluster", "duplicate_type", "headline"] + ([id_column] if id_column else [])
+    duplicates = df.loc[df["duplicate_cluster"].to_numpy() >= 0, columns]
+    if duplicates.empty:
+        return pd.DataFrame(columns=CLUSTER_COLUMNS)
+
+    ids = duplicates[id_column] if id_column else duplicates.index.to_series()
+    grouped = duplicates.assign(_id=ids.astype(str)).groupby("duplicate_cluster", sort=True)
+    clusters = grouped.agg(
+        duplicate_type=("duplicate_type", "first"),
+        size=("_id", "size"),
+        primary_ad_id=("_id", "first"),
+        headline=("headline", "first"),
+        ad_ids=("_id", list),
+    ).reset_index()
+    return clusters.sort_values("size", ascending=False, kind="stable").reset_index(drop=True)[CLUSTER_COLUMNS]
+
+def _cluster_near_duplicates(texts, threshold, num_perm, bands, shingle_size, report):
+    """Group texts whose estimated Jaccard similarity exceeds the threshold, calling report(fraction, message) as work proceeds"""
+    signatures = _minhash_signatures(texts, num_perm, shingle_size, report=report)
+    rows = num_perm // bands
+    multipliers = np.random.default_rng(2).integers(1, 2**63, size=rows, dtype=np.uint64) | np.uint64(1)
+
+    # Candidate pairs: every member of an LSH bucket paired with the bucket's
+    # first member, which keeps the number of pairs linear in the texts
+    candidates = []
+    for band in range(bands):
+        report(0.6 + 0.2 * band / bands, f"Bucketing near-duplicate candidates (band {band + 1} of {bands})...")
+        with np.errstate(over="ignore"):
+            keys = (signatures[:, band * rows:(band + 1) * rows].astype(np.uint64) * multipliers).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        is_first = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        heads = order[np.flatnonzero(is_first)[np.cumsum(is_first) - 1]]
+        candidates.append(heads[~is_first].astype(np.int64) * len(texts) + order[~is_first])
+    pairs = np.unique(np.concatenate(candidates))
+    first, second = pairs // len(texts), pairs % len(texts)
+
+    # Keep the pairs whose signatures agree often enough, in bounded blocks
+    similar = np.zeros(len(pairs), dtype=bool)
+    block = max(1, 4_000_000 // num_perm)
+    for start in range(0, len(pairs), block):
+        report(0.8 + 0.15 * start / len(pairs), f"Comparing {len(pairs)} near-duplicate candidate pairs...")
+        stop = start + block
+        agreement = (signatures[first[start:stop]] == signatures[second[start:stop]]).mean(axis=1)
+        similar[start:stop] = agreement >= threshold
+
+    return _connected_components(len(texts), first[similar], second[similar])
+
+def _connected_components(count, first, second):
+    """Label each node with the smallest node index of its connected component"""
+    labels = np.arange(count)
+    while True:
+        # Pull every edge's endpoints to their smaller label, then shortcut chains
+        smaller = np.minimum(labels[first], labels[second])
+        updated = labels.copy()
+        np.minimum.at(updated, first, smaller)
+        np.minimum.at(updated, second, smaller)
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+def _minhash_signatures(texts, num_perm, shingle_size, chunk_chars=1 << 20, report=None):
+    """
+    Compute one-permutation MinHash signatures of character shingles
+
+    Each text's shingles are hashed once and split into num_perm bins by hash
+    value; a bin's signature value is its smallest hash. Empty bins borrow the
+    next non-empty bin's value so short texts still get full signatures. Texts
+    are processed in blocks of about chunk_chars characters, hashing every
+    shingle of a block with vectorized operations on its code points; report
+    is called as report(fraction, message) before each block (optional).
+    """
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    signatures = np.full((len(texts), num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    padding = "\0" * (shingle_size - 1)
+
+    start = 0
+    ends = np.searchsorted(np.cumsum(lengths), np.arange(chunk_chars, lengths.sum() + chunk_chars, chunk_chars), side="right")
+    for end in ends:
+        end = max(int(end), start + 1)
+        if start >= len(texts):
+            break
+        if report is not None:
+            report(0.1 + 0.5 * start / len(texts), f"Hashing {len(texts)} distinct copy texts...")
+        block, block_lengths = texts[start:end], lengths[start:end]
+
+        # Code points of the block, each text followed by padding so no
+        # shingle reaches into the next text
+        code_points = np.frombuffer((padding.join(block) + padding).encode("utf-32-le"), dtype=np.uint32)
+        positions = code_points.size - (shingle_size - 1)
+        with np.errstate(over="ignore"):
+            hashes = code_points[:positions].copy()
+            for offset in range(1, shingle_size):
+                hashes *= np.uint32(0x01000193)
+                hashes ^= code_points[offset:offset + positions]
+            # murmur3 finalizer to spread the bits
+            hashes ^= hashes >> np.uint32(16)
+            hashes *= np.uint32(0x85EBCA6B)
+            hashes ^= hashes >> np.uint32(13)
+            hashes *= np.uint32(0xC2B2AE35)
+            hashes ^= hashes >> np.uint32(16)
+
+        # Keep shingles starting inside a text, not inside its padding
+        repeats = np.empty(2 * len(block), dtype=np.int64)
+        repeats[0::2] = block_lengths
+        repeats[1::2] = shingle_size - 1
+        starts_in_text = np.repeat(np.tile(np.array([True, False]), len(block)), repeats)[:positions]
+        hashes = hashes[starts_in_text]
+        text_index = np.repeat(np.arange(len(block), dtype=np.int64), block_lengths)
+
+        block_signatures = signatures[start:end]
+        bins = (hashes % np.uint32(num_perm)).astype(np.int64)
+        np.minimum.at(block_signatures.reshape(-1), text_index * num_perm + bins, hashes)
+        signatures[start:end] = _densify(block_signatures)
+        start = end
+
+    return signatures
+
+def _densify(signatures):
+    """Fill empty signature bins from the next non-empty bin, wrapping around"""
+    empty = signatures == np.iinfo(np.uint32).max
+    if not empty.any():
+        return signatures
+    num_perm = signatures.shape[1]
+    columns = np.arange(2 * num_perm)
+    filled = np.tile(~empty, 2)
+    next_filled = np.where(filled, columns, 2 * num_perm)
+    next_filled = np.minimum.accumulate(next_filled[:, ::-1], axis=1)[:, ::-1][:, :num_perm]
+
+    # Rows without any shingle keep their empty signature
+    has_value = next_filled < 2 * num_perm
+    source = np.where(has_value, next_filled % num_perm, 0)
+    distance = (next_filled - columns[:num_perm]).astype(np.uint32)
+    with np.errstate(over="ignore"):
+        borrowed = np.take_along_axis(signatures, source, axis=1) + distance * np.uint32(0x9E3779B1)
+    return np.where(empty & has_value, borrowed, signatures)
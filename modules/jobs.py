@@ -0,0 +1,189 @@
+# modules/jobs.py
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+class JobCancelled(Exception):
+    """Raised inside a running job when cancellation has been requested"""
+
+class Job:
+    """A long-running stage executed in the background"""
+
+    def __init__(self, session_id, kind, label=None):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.kind = kind
+        self.label = label or kind
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = "Waiting to start..."
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in ("completed", "failed", "cancelled")
+
+    def report(self, fraction, message=None):
+        """
+        Progress callback passed to the job function
+
+        Raises JobCancelled when the job has been cancelled so the stage stops
+        at its next progress update.
+        """
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    def cancel(self):
+        """Request cancellation of the job"""
+        self._cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self._finish("cancelled", message="Cancelled")
+
+    def _finish(self, status, result=None, error=None, message=None):
+        # Status goes last so readers never see a finished job without its result
+        self.result = result
+        self.error = error
+        if message is not None:
+            self.message = message
+        self.finished_at = time.time()
+        self.status = status
+
+class JobManager:
+    """
+    Runs generation stages on a background thread pool
+
+    Jobs are indexed by session id so a browser session can re-attach to its
+    jobs after a refresh, and each session gets its own scratch directory.
+    Finished jobs hold their results in memory, so they are forgotten once
+    they are older than finished_job_ttl seconds or when more than
+    max_finished_jobs have piled up across all sessions.
+    """
+
+    def __init__(self, base_dir="temp/sessions", max_workers=2, max_jobs_per_session=20,
+                 finished_job_ttl=3600, max_finished_jobs=100):
+        self.base_dir = base_dir
+        self.max_jobs_per_session = max_jobs_per_session
+        self.finished_job_ttl = finished_job_ttl
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ad-generator-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def workspace(self, session_id):
+        """Return (and create) the scratch directory of a session"""
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session id: {session_id}")
+        path = os.path.join(self.base_dir, session_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def submit(self, session_id, kind, func, *args, label=None, **kwargs):
+        """
+        Submit a function to run in the background
+
+        Parameters:
+        - session_id: Session owning the job
+        - kind: Job type used to look the job up again (e.g. "master_csv")
+        - func: Function to run; it receives a progress_callback keyword argument
+        - label: Human readable job name (optional)
+
+        Returns:
+        - The submitted Job
+        """
+        job = Job(session_id, kind, label)
+        with self._lock:
+            jobs = self._jobs.setdefault(session_id, [])
+            jobs.append(job)
+            # Forget the oldest finished jobs of the session
+            while len(jobs) > self.max_jobs_per_session and jobs[0].done:
+                jobs.pop(0)
+            self._evict_finished_jobs()
+        job.future = self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get_jobs(self, session_id, kind=None):
+        """Return the jobs of a session, newest first"""
+        with self._lock:
+            self._evict_finished_jobs()
+            jobs = list(self._jobs.get(session_id, []))
+        if kind is not None:
+            jobs = [job for job in jobs if job.kind == kind]
+        return list(reversed(jobs))
+
+    def latest_job(self, session_id, kind):
+        """Return the most recent job of the given kind, or None"""
+        jobs = self.get_jobs(session_id, kind)
+        return jobs[0] if jobs else None
+
+    def cleanup_stale_workspaces(self, max_age_hours=24):
+        """Delete session directories that have not been modified recently"""
+        if not os.path.isdir(self.base_dir):
+            return 0
+        cutoff = time.time() - max_age_hours * 3600
+        removed = 0
+        for name in os.listdir(self.base_dir):
+            path = os.path.join(self.base_dir, name)
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff and not self._has_active_jobs(name):
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def _evict_finished_jobs(self):
+        """Forget expired finished jobs and cap finished jobs across sessions; call with the lock held"""
+        cutoff = time.time() - self.finished_job_ttl
+        finished = sorted(
+            (job for jobs in self._jobs.values() for job in jobs if job.done),
+            key=lambda job: job.finished_at
+        )
+        evicted = {job.job_id for job in finished if job.finished_at < cutoff}
+        evicted.update(job.job_id for job in finished[:max(0, len(finished) - self.max_finished_jobs)])
+        if not evicted:
+            return
+
+        for session_id in list(self._jobs):
+            jobs = [job for job in self._jobs[session_id] if job.job_id not in evicted]
+            if jobs:
+                self._jobs[session_id] = jobs
+            else:
+                del self._jobs[session_id]
+
+    def _has_active_jobs(self, session_id):
+        return any(not job.done for job in self.get_jobs(session_id))
+
+    def _run(self, job, func, args, kwargs):
+        if job._cancel_event.is_set():
+            job._finish("cancelled", message="Cancelled")
+            return
+        job.status = "running"
+        job.message = "Running..."
+        try:
+            result = func(*args, progress_callback=job.report, **kwargs)
+        except JobCancelled:
+            job._finish("cancelled", message="Cancelled")
+        except Exception as e:
+            job._finish("failed", error=str(e), message=f"Failed: {str(e)}")
+        else:
+            job.progress = 1.0
+            job._finish("completed", result=result, message="Done")
+
+def new_session_id():
+    """Generate a new random session id"""
+    return uuid.uuid4().hex
+
+def is_valid_session_id(session_id):
+    """Check that a session id is safe to use as a directory name"""
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
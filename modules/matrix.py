@@ -1,5 +1,28 @@
 # modules/matrix.py
-def define_matrix_structure(personas=None, funnel_stages=None, property_types=None, locations=None):
+from modules.models import MatrixCell
+
+# Order in which the dimensions are enumerated; rules are evaluated at the
+# shallowest level where every dimension they reference is already bound.
+MATRIX_DIMENSIONS = ["persona_id", "funnel_stage", "property_type", "location"]
+
+DEFAULT_PERSONAS = [
+    {"id": "retiree", "name": "Manuel", "age": "50-65", "situation": "retirement planning"},
+    {"id": "family", "name": "Sofía", "age": "30-45", "situation": "family upgrading"},
+    {"id": "investor", "name": "Carlos", "age": "35-55", "situation": "investment properties"}
+]
+
+DEFAULT_FUNNEL_STAGES = [
+    {"id": "awareness", "intent": "discovery", "cta_type": "learn more"},
+    {"id": "interest", "intent": "consideration", "cta_type": "get value"},
+    {"id": "decision", "intent": "evaluation", "cta_type": "free valuation"},
+    {"id": "action", "intent": "conversion", "cta_type": "value now"}
+]
+
+DEFAULT_PROPERTY_TYPES = ["casa", "departamento", "terreno", "local comercial"]
+
+DEFAULT_LOCATIONS = ["Tampico", "Ciudad Madero", "Altamira", "Tamaulipas"]
+
+def define_matrix_structure(personas=None, funnel_stages=None, property_types=None, locations=None, rules=None):
     """
     Define the matrix structure for ad generation
     
@@ -8,50 +31,144 @@ def define_matrix_structure(personas=None, funnel_stages=None, property_types=No
     - funnel_stages: List of funnel stage dictionaries (optional)
     - property_types: List of property types (optional)
     - locations: List of locations (optional)
+    - rules: List of include/exclude rule dictionaries (optional, see normalize_matrix_rules)
     
     Returns:
-    - Dictionary with matrix structure
+    - Dictionary with matrix structure; "matrix" is a list of MatrixCell objects
     """
     # Default values if not provided
     if personas is None:
-        personas = [
-            {"id": "retiree", "name": "Manuel", "age": "50-65", "situation": "retirement planning"},
-            {"id": "family", "name": "Sofía", "age": "30-45", "situation": "family upgrading"},
-            {"id": "investor", "name": "Carlos", "age": "35-55", "situation": "investment properties"}
-        ]
+        personas = [dict(persona) for persona in DEFAULT_PERSONAS]
     
     if funnel_stages is None:
-        funnel_stages = [
-            {"id": "awareness", "intent": "discovery", "cta_type": "learn more"},
-            {"id": "interest", "intent": "consideration", "cta_type": "get value"},
-            {"id": "decision", "intent": "evaluation", "cta_type": "free valuation"},
-            {"id": "action", "intent": "conversion", "cta_type": "value now"}
-        ]
+        funnel_stages = [dict(stage) for stage in DEFAULT_FUNNEL_STAGES]
     
     if property_types is None:
-        property_types = ["casa", "departamento", "terreno", "local comercial"]
+        property_types = list(DEFAULT_PROPERTY_TYPES)
     
     if locations is None:
-        locations = ["Tampico", "Ciudad Madero", "Altamira", "Tamaulipas"]
+        locations = list(DEFAULT_LOCATIONS)
+
+    rules = normalize_matrix_rules(rules)
 
-    # Create combinations matrix
+    # Group rules by the enumeration depth at which they become decidable
+    rules_by_depth = [[] for _ in MATRIX_DIMENSIONS]
+    for rule in rules:
+        rules_by_depth[rule["depth"]].append(rule)
+
+    # Number of leaf combinations below each depth, used to count pruned branches
+    sizes = [len(personas), len(funnel_stages), len(property_types), len(locations)]
+    remaining = [1] * len(sizes)
+    for depth in range(len(sizes) - 2, -1, -1):
+        remaining[depth] = remaining[depth + 1] * sizes[depth + 1]
+
+    removed = {rule["name"]: 0 for rule in rules}
+
+    def pruned(depth, bound):
+        for rule in rules_by_depth[depth]:
+            if _rule_removes(rule, bound):
+                removed[rule["name"]] += remaining[depth]
+                return True
+        return False
+
+    # Create combinations matrix, skipping excluded branches as soon as a rule decides them
     matrix = []
+    bound = {}
     for persona in personas:
+        bound["persona_id"] = persona["id"]
+        if pruned(0, bound):
+            continue
         for stage in funnel_stages:
+            bound["funnel_stage"] = stage["id"]
+            if pruned(1, bound):
+                continue
             for prop_type in property_types:
+                bound["property_type"] = prop_type
+                if pruned(2, bound):
+                    continue
                 for location in locations:
-                    matrix.append({
-                        "persona_id": persona["id"],
-                        "persona_name": persona["name"],
-                        "funnel_stage": stage["id"],
-                        "property_type": prop_type,
-                        "location": location,
-                    })
-
-    return {
+                    bound["location"] = location
+                    if pruned(3, bound):
+                        continue
+                    matrix.append(MatrixCell(persona["id"], persona["name"], stage["id"], prop_type, location))
+
+    matrix_data = {
         "personas": personas,
         "funnel_stages": funnel_stages,
         "property_types": property_types,
         "locations": locations,
         "matrix": matrix
-    }
\ No newline at end of file
+    }
+
+    if rules:
+        matrix_data["pruning"] = {
+            "rules": [{key: rule[key] for key in ("name", "action", "when", "match")} for rule in rules],
+            "removed": removed,
+            "total_removed": sum(removed.values())
+        }
+
+    return matrix_data
+
+def normalize_matrix_rules(rules):
+    """
+    Validate include/exclude rules and prepare them for evaluation
+    
+    Each rule is a dictionary with:
+    - action: "exclude" drops combinations where both `when` and `match` apply;
+      "include" drops combinations where `when` applies but `match` does not
+    - match: Dictionary of dimension -> value or list of values
+    - when: Optional dictionary of dimension -> value or list of values
+    - name: Optional label used when reporting removed combinations
+    
+    Dimensions are persona_id, funnel_stage, property_type and location.
+    
+    Returns:
+    - List of normalized rule dictionaries
+    """
+    normalized = []
+    for index, rule in enumerate(rules or []):
+        action = rule.get("action", "exclude")
+        if action not in ("include", "exclude"):
+            raise ValueError(f"Rule {index + 1}: action must be 'include' or 'exclude', got '{action}'")
+
+        conditions = {}
+        for part in ("when", "match"):
+            values = {}
+            for dimension, allowed in (rule.get(part) or {}).items():
+                if dimension not in MATRIX_DIMENSIONS:
+                    raise ValueError(f"Rule {index + 1}: unknown dimension '{dimension}'")
+                if isinstance(allowed, str):
+                    allowed = [allowed]
+                values[dimension] = list(allowed)
+            conditions[part] = values
+
+        if not conditions["match"]:
+            raise ValueError(f"Rule {index + 1}: 'match' must reference at least one dimension")
+
+        referenced = set(conditions["when"]) | set(conditions["match"])
+        name = rule.get("name") or f"{action} " + ", ".join(
+            f"{dimension}={'|'.join(values)}"
+            for part in ("when", "match")
+            for dimension, values in conditions[part].items()
+        )
+        if any(existing["name"] == name for existing in normalized):
+            name = f"{name} (#{index + 1})"
+
+        normalized.append({
+            "name": name,
+            "action": action,
+            "when": conditions["when"],
+            "match": conditions["match"],
+            "depth": max(MATRIX_DIMENSIONS.index(dimension) for dimension in referenced),
+            "_when": {dimension: set(values) for dimension, values in conditions["when"].items()},
+            "_match": {dimension: set(values) for dimension, values in conditions["match"].items()}
+        })
+
+    return normalized
+
+def _rule_removes(rule, bound):
+    """Return True if the rule removes every combination below the bound values"""
+    if not all(bound[dimension] in values for dimension, values in rule["_when"].items()):
+        return False
+    matches = all(bound[dimension] in values for dimension, values in rule["_match"].items())
+    return matches if rule["action"] == "exclude" else not matches
@@ -0,0 +1,236 @@
+# modules/models.py
+import sys
+
+def _intern(value):
+    """Intern strings repeated across many objects so they share one copy"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+class MatrixCell:
+    """One persona x funnel stage x property type x location combination"""
+
+    __slots__ = ("persona_id", "persona_name", "funnel_stage", "property_type", "location")
+
+    def __init__(self, persona_id, persona_name, funnel_stage, property_type, location):
+        self.persona_id = _intern(persona_id)
+        self.persona_name = _intern(persona_name)
+        self.funnel_stage = _intern(funnel_stage)
+        self.property_type = _intern(property_type)
+        self.location = _intern(location)
+
+    def __repr__(self):
+        return f"MatrixCell({self.persona_id!r}, {self.funnel_stage!r}, {self.property_type!r}, {self.location!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, MatrixCell) and self.to_json() == other.to_json()
+
+    def to_json(self):
+        return {
+            "persona_id": self.persona_id,
+            "persona_name": self.persona_name,
+            "funnel_stage": self.funnel_stage,
+            "property_type": self.property_type,
+            "location": self.location,
+        }
+
+class Ad:
+    """A single ad with its rendered copy"""
+
+    __slots__ = (
+        "ad_id", "headline", "description", "cta_text", "image_code", "property_type",
+        "duplicate_cluster", "duplicate_type", "duplicate_primary"
+    )
+
+    def __init__(self, ad_id, headline, description, cta_text, image_code, property_type,
+                 duplicate_cluster=None, duplicate_type=None, duplicate_primary=None):
+        self.ad_id = ad_id
+        self.headline = headline
+        self.description = description
+        self.cta_text = _intern(cta_text)
+        self.image_code = _intern(image_code)
+        self.property_type = _intern(property_type)
+        self.duplicate_cluster = duplicate_cluster
+        self.duplicate_type = _intern(duplicate_type)
+        self.duplicate_primary = duplicate_primary
+
+    def __repr__(self):
+        return f"Ad({self.ad_id!r}, {self.headline!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, Ad) and self.to_json() == other.to_json()
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data["ad_id"], data["headline"], data["description"], data["cta_text"],
+            data["image_code"], data["property_type"],
+            data.get("duplicate_cluster"), data.get("duplicate_type"), data.get("duplicate_primary")
+        )
+
+    def to_json(self):
+        data = {
+            "ad_id": self.ad_id,
+            "headline": self.headline,
+            "description": self.description,
+            "cta_text": self.cta_text,
+            "image_code": self.image_code,
+            "property_type": self.property_type
+        }
+        if self.duplicate_cluster is not None:
+            data["duplicate_cluster"] = self.duplicate_cluster
+            data["duplicate_type"] = self.duplicate_type
+            data["duplicate_primary"] = self.duplicate_primary
+        return data
+
+class LocationGroup:
+    """
+    The ads of an ad set for one location
+
+    Summaries of campaign structures that stay on disk have no ads loaded;
+    their groups have ads=None and only know their ad_count.
+    """
+
+    __slots__ = ("location", "name", "ads", "daily_budget", "_ad_count")
+
+    def __init__(self, location, name, ads, daily_budget=None, ad_count=None):
+        self.location = _intern(location)
+        self.name = name
+        self.ads = ads
+        self.daily_budget = daily_budget
+        self._ad_count = ad_count
+
+    def __repr__(self):
+        return f"LocationGroup({self.name!r}, ads={self.ad_count})"
+
+    @property
+    def ad_count(self):
+        return self._ad_count if self.ads is None else len(self.ads)
+
+    @classmethod
+    def from_json(cls, location, data):
+        if "ads" not in data:
+            return cls(location, data["name"], None, data.get("daily_budget"), data["ad_count"])
+        return cls(location, data["name"], [Ad.from_json(ad) for ad in data["ads"]], data.get("daily_budget"))
+
+    def to_json(self, include_ads=True):
+        data = {"name": self.name}
+        if include_ads and self.ads is not None:
+            data["ads"] = [ad.to_json() for ad in self.ads]
+        else:
+            data["ad_count"] = self.ad_count
+        if self.daily_budget is not None:
+            data["daily_budget"] = self.daily_budget
+        return data
+
+class AdSet:
+    """
+    A persona ad set with its targeting and location groups
+
+    The ad set key is the persona id, except for parts of a split ad set
+    ("family_2"), which keep the persona id in persona_id.
+    """
+
+    __slots__ = ("key", "name", "targeting", "locations", "daily_budget", "persona_id", "_ad_count")
+
+    def __init__(self, key, name, targeting, locations, daily_budget=None, persona_id=None):
+        self.key = _intern(key)
+        self.name = name
+        self.targeting = targeting
+        self.locations = locations
+        self.daily_budget = daily_budget
+        self.persona_id = self.key if persona_id is None else _intern(persona_id)
+        self.refresh_counts()
+
+    def __repr__(self):
+        return f"AdSet({self.name!r}, locations={len(self.locations)}, ads={self.ad_count})"
+
+    def refresh_counts(self):
+        """Recompute cached counts after changing the locations or their ads"""
+        self._ad_count = sum(group.ad_count for group in self.locations.values())
+
+    @property
+    def ad_count(self):
+        return self._ad_count
+
+    @property
+    def location_count(self):
+        return len(self.locations)
+
+    @classmethod
+    def from_json(cls, key, data):
+        locations = {location: LocationGroup.from_json(location, group) for location, group in data["locations"].items()}
+        return cls(key, data["name"], data["targeting"], locations, data.get("daily_budget"), data.get("persona_id"))
+
+    def to_json(self, include_ads=True):
+        data = {"name": self.name}
+        if self.persona_id != self.key:
+            data["persona_id"] = self.persona_id
+        data["targeting"] = self.targeting
+        data["locations"] = {location: group.to_json(include_ads) for location, group in self.locations.items()}
+        if self.daily_budget is not None:
+            data["daily_budget"] = self.daily_budget
+        return data
+
+class Campaign:
+    """A funnel stage campaign with its ad sets"""
+
+    __slots__ = ("key", "name", "objective", "ad_sets", "daily_budget", "_ad_count", "_location_count")
+
+    def __init__(self, key, name, objective, ad_sets, daily_budget=None):
+        self.key = _intern(key)
+        self.name = name
+        self.objective = _intern(objective)
+        self.ad_sets = ad_sets
+        self.daily_budget = daily_budget
+        self.refresh_counts()
+
+    def __repr__(self):
+        return f"Campaign({self.name!r}, ad_sets={self.ad_set_count}, ads={self.ad_count})"
+
+    def refresh_counts(self):
+        """Recompute cached counts after changing the ad sets"""
+        self._ad_count = sum(ad_set.ad_count for ad_set in self.ad_sets.values())
+        self._location_count = sum(ad_set.location_count for ad_set in self.ad_sets.values())
+
+    @property
+    def ad_count(self):
+        return self._ad_count
+
+    @property
+    def ad_set_count(self):
+        return len(self.ad_sets)
+
+    @property
+    def location_count(self):
+        return self._location_count
+
+    @classmethod
+    def from_json(cls, key, data):
+        ad_sets = {ad_set_key: AdSet.from_json(ad_set_key, ad_set) for ad_set_key, ad_set in data["ad_sets"].items()}
+        return cls(key, data["name"], data["objective"], ad_sets, data.get("daily_budget"))
+
+    def to_json(self, include_ads=True):
+        data = {
+            "name": self.name,
+            "objective": self.objective,
+            "ad_sets": {ad_set_key: ad_set.to_json(include_ads) for ad_set_key, ad_set in self.ad_sets.items()}
+        }
+        if self.daily_budget is not None:
+            data["daily_budget"] = self.daily_budget
+        return data
+
+def campaigns_from_json(campaigns_json):
+    """Convert the campaign structure JSON into Campaign objects keyed like the JSON"""
+    return {key: Campaign.from_json(key, campaign) for key, campaign in campaigns_json.items()}
+
+def campaigns_to_json(campaigns, include_ads=True):
+    """
+    Convert Campaign objects back into the campaign structure JSON
+
+    With include_ads=False each location group has an ad_count instead of its
+    ads, which is the summary campaigns_from_json() loads without any ads.
+    """
+    return {key: campaign.to_json(include_ads) for key, campaign in campaigns.items()}
+
+def matrix_to_json(matrix_data):
+    """Convert matrix data from define_matrix_structure() into JSON, with its MatrixCell objects as dictionaries"""
+    return dict(matrix_data, matrix=[cell.to_json() for cell in matrix_data["matrix"]])
@@ -0,0 +1,239 @@
+# modules/overlap.py
+import numpy as np
+import pandas as pd
+
+# Parent region of each location; a location's audience contains its children's
+DEFAULT_LOCATION_PARENTS = {
+    "Tampico": "Tamaulipas",
+    "Ciudad Madero": "Tamaulipas",
+    "Altamira": "Tamaulipas"
+}
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+def build_targeting_table(campaigns):
+    """
+    Flatten the campaign structure into one targeting row per ad set location
+
+    Parameters:
+    - campaigns: Dictionary of Campaign objects (see models.campaigns_from_json)
+
+    Returns:
+    - DataFrame with campaign, ad_set, location, name, age_min, age_max and interests
+    """
+    rows = []
+    for campaign_key, campaign in campaigns.items():
+        for ad_set_key, ad_set in campaign.ad_sets.items():
+            targeting = ad_set.targeting
+            for location, location_group in ad_set.locations.items():
+                rows.append({
+                    "campaign": campaign_key,
+                    "ad_set": ad_set_key,
+                    "location": location,
+                    "name": location_group.name,
+                    "age_min": targeting["age_min"],
+                    "age_max": targeting["age_max"],
+                    "interests": tuple(targeting["interests"])
+                })
+    return pd.DataFrame(rows, columns=["campaign", "ad_set", "location", "name", "age_min", "age_max", "interests"])
+
+def encode_bitsets(item_sets, universe=None):
+    """
+    Encode sets of items as packed bitsets
+
+    Parameters:
+    - item_sets: List of iterables of hashable items
+    - universe: Ordered list of all items (optional, derived from item_sets)
+
+    Returns:
+    - Tuple of (uint64 array of shape (len(item_sets), words), universe)
+    """
+    if universe is None:
+        universe = list(dict.fromkeys(item for items in item_sets for item in items))
+    positions = {item: position for position, item in enumerate(universe)}
+    words = max(1, (len(universe) + 63) // 64)
+    bits = np.zeros((len(item_sets), words * 64), dtype=bool)
+    for row, items in enumerate(item_sets):
+        bits[row, [positions[item] for item in items]] = True
+    packed = np.packbits(bits, axis=1, bitorder="little")
+    return packed.view(np.uint64).reshape(len(item_sets), words), universe
+
+def bitset_overlap(bitsets):
+    """
+    Pairwise overlap coefficient |A & B| / min(|A|, |B|) between bitsets
+
+    Returns:
+    - Float array of shape (n, n)
+    """
+    sizes = _popcount(bitsets)
+    common = _popcount(bitsets[:, None, :] & bitsets[None, :, :])
+    smaller = np.minimum(sizes[:, None], sizes[None, :])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(smaller > 0, common / smaller, 0.0)
+
+def location_leaf_sets(locations, parents=None):
+    """
+    Describe each location as the set of leaf regions it covers
+
+    A location with children also covers an implicit "rest of" leaf, so a
+    child is contained in its parent but does not cover the whole parent.
+    """
+    parents = DEFAULT_LOCATION_PARENTS if parents is None else parents
+    children = {}
+    for child, parent in parents.items():
+        children.setdefault(parent, []).append(child)
+
+    def leaves(location, seen=()):
+        if location in seen:
+            raise ValueError(f"Location hierarchy has a cycle at '{location}'")
+        result = {f"{location} (rest)" if location in children else location}
+        for child in children.get(location, []):
+            result |= leaves(child, seen + (location,))
+        return result
+
+    return [leaves(location) for location in locations]
+
+def compute_overlap_matrix(table, location_parents=None, interest_weight=0.0):
+    """
+    Estimate pairwise audience overlap between ad set locations
+
+    Age ranges are compared as intervals, interests and locations as bitsets.
+    Each component is an overlap coefficient (shared share of the smaller
+    audience). The overall overlap is the age overlap times the location
+    overlap; interest lists are hand-picked per persona and rarely share
+    entries, so interests are reported separately and only narrow the
+    overall overlap as much as interest_weight asks.
+
+    Parameters:
+    - table: Output of build_targeting_table()
+    - location_parents: Dictionary of location -> parent location (optional)
+    - interest_weight: How much interests narrow the overall overlap, from 0 (not at all) to 1 (fully)
+
+    Returns:
+    - Dictionary of (n, n) float32 arrays: age, interests, location and overlap
+    """
+    codes, components = _profile_overlap(table, location_parents, interest_weight)
+    return {name: matrix[codes[:, None], codes[None, :]] for name, matrix in components.items()}
+
+def find_overlapping_ad_sets(campaigns, min_overlap=0.5, top=50, location_parents=None, interest_weight=0.0):
+    """
+    Report the most overlapping pairs of ad set locations
+
+    Work is done on the distinct targeting profiles, so thousands of ad set
+    locations sharing a handful of personas and locations cost no more than
+    the profiles themselves.
+
+    Parameters:
+    - campaigns: Dictionary of Campaign objects (see models.campaigns_from_json)
+    - min_overlap: Smallest overall overlap to report
+    - top: Maximum number of pairs to return (None for all)
+    - location_parents: Dictionary of location -> parent location (optional)
+    - interest_weight: How much interests narrow the overall overlap (see compute_overlap_matrix)
+
+    Returns:
+    - Tuple of (pairs DataFrame sorted by overlap, per ad set summary DataFrame)
+    """
+    table = build_targeting_table(campaigns)
+    pair_columns = ["name_a", "name_b", "age", "interests", "location", "overlap"]
+    if table.empty:
+        return pd.DataFrame(columns=pair_columns), pd.DataFrame(columns=["name", "overlapping_ad_sets", "max_overlap"])
+
+    codes, components = _profile_overlap(table, location_parents, interest_weight)
+    overlap = components["overlap"]
+    profile_count = len(overlap)
+    counts = np.bincount(codes, minlength=profile_count)
+
+    # Per ad set location: how many others overlap it, and by how much at most
+    hits = overlap >= min_overlap
+    overlapping = (hits * counts[None, :]).sum(axis=1) - hits.diagonal()
+    others = counts[None, :] - np.eye(profile_count, dtype=counts.dtype) > 0
+    max_overlap = np.where(others, overlap, 0).max(axis=1)
+    names = table["name"].to_numpy()
+    summary = pd.DataFrame({
+        "name": names,
+        "overlapping_ad_sets": overlapping[codes],
+        "max_overlap": max_overlap[codes]
+    }).sort_values(["overlapping_ad_sets", "max_overlap"], ascending=False, kind="stable").reset_index(drop=True)
+
+    # Worst pairs: walk profile pairs from the highest overlap down and expand their members
+    first, second = np.triu_indices(profile_count)
+    pair_counts = np.where(first == second, counts[first] * (counts[first] - 1) // 2, counts[first] * counts[second])
+    keep = (overlap[first, second] >= min_overlap) & (pair_counts > 0)
+    first, second, pair_counts = first[keep], second[keep], pair_counts[keep]
+    order = np.argsort(-overlap[first, second], kind="stable")
+    if top is not None:
+        needed = np.searchsorted(np.cumsum(pair_counts[order]), top) + 1
+        order = order[:needed]
+
+    members = np.argsort(codes, kind="stable")
+    starts = np.r_[0, np.cumsum(counts)]
+    rows_a, rows_b = [], []
+    for profile_a, profile_b in zip(first[order], second[order]):
+        members_a = members[starts[profile_a]:starts[profile_a + 1]]
+        members_b = members[starts[profile_b]:starts[profile_b + 1]]
+        if profile_a == profile_b:
+            left, right = np.triu_indices(len(members_a), k=1)
+            rows_a.append(members_a[left])
+            rows_b.append(members_a[right])
+        else:
+            rows_a.append(np.repeat(members_a, len(members_b)))
+            rows_b.append(np.tile(members_b, len(members_a)))
+
+    rows_a = np.concatenate(rows_a) if rows_a else np.zeros(0, dtype=int)
+    rows_b = np.concatenate(rows_b) if rows_b else np.zeros(0, dtype=int)
+    if top is not None:
+        rows_a, rows_b = rows_a[:top], rows_b[:top]
+
+    pairs = pd.DataFrame({"name_a": names[rows_a], "name_b": names[rows_b]})
+    for name in ["age", "interests", "location", "overlap"]:
+        pairs[name] = components[name][codes[rows_a], codes[rows_b]]
+    return pairs, summary
+
+def _profile_overlap(table, location_parents, interest_weight):
+    """
+    Compute overlap components between the distinct targeting profiles
+
+    Returns:
+    - Tuple of (profile code per row, dictionary of (k, k) float32 matrices)
+    """
+    # Age ranges: inclusive interval overlap over the shorter range
+    age_codes, age_ranges = pd.factorize(pd.MultiIndex.from_frame(table[["age_min", "age_max"]]))
+    age_min = np.array([age_range[0] for age_range in age_ranges], dtype=float)
+    age_max = np.array([age_range[1] for age_range in age_ranges], dtype=float)
+    shared = np.clip(np.minimum(age_max[:, None], age_max[None, :]) - np.maximum(age_min[:, None], age_min[None, :]) + 1, 0, None)
+    lengths = age_max - age_min + 1
+    age_overlap = shared / np.minimum(lengths[:, None], lengths[None, :])
+
+    # Interests: bitsets of the distinct interest lists
+    interest_codes, interest_lists = pd.factorize(table["interests"])
+    interest_bits, _ = encode_bitsets(list(interest_lists))
+    interest_overlap = bitset_overlap(interest_bits)
+
+    # Locations: bitsets of covered leaf regions
+    location_codes, location_names = pd.factorize(table["location"])
+    location_bits, _ = encode_bitsets(location_leaf_sets(list(location_names), location_parents))
+    location_overlap = bitset_overlap(location_bits)
+
+    # Distinct (age, interests, location) profiles
+    interest_count, location_count = len(interest_lists), len(location_names)
+    joint = (age_codes.astype(np.int64) * interest_count + interest_codes) * location_count + location_codes
+    codes, profiles = pd.factorize(joint)
+    profile_ages = profiles // (interest_count * location_count)
+    profile_interests = (profiles // location_count) % interest_count
+    profile_locations = profiles % location_count
+
+    components = {
+        "age": age_overlap[profile_ages[:, None], profile_ages[None, :]].astype(np.float32),
+        "interests": interest_overlap[profile_interests[:, None], profile_interests[None, :]].astype(np.float32),
+        "location": location_overlap[profile_locations[:, None], profile_locations[None, :]].astype(np.float32)
+    }
+    overlap = components["age"] * components["location"]
+    if interest_weight:
+        overlap = overlap * (1 - interest_weight + interest_weight * components["interests"])
+    components["overlap"] = overlap.astype(np.float32)
+    return codes, components
+
+def _popcount(bitsets):
+    """Number of set bits along the last axis of a uint64 array"""
+    as_bytes = np.ascontiguousarray(bitsets).view(np.uint8)
+    return _POPCOUNT[as_bytes].sum(axis=-1, dtype=np.int64)
@@ -0,0 +1,270 @@
+# modules/packing.py
+from heapq import heappop, heappush
+from modules.models import Campaign, AdSet, LocationGroup
+
+# Facebook allows at most 50 ads in one ad set
+DEFAULT_MAX_ADS_PER_AD_SET = 50
+
+def pack_campaign_structure(campaigns, max_ads_per_ad_set=DEFAULT_MAX_ADS_PER_AD_SET, max_ads_per_campaign=None):
+    """
+    Split ad sets and campaigns that hold more ads than allowed
+
+    Oversized ad sets are split as planned by plan_ad_set_parts() and bin
+    packed (best fit decreasing) into as few ad sets as possible, so small
+    pieces of the same persona are merged back together. Parts are numbered
+    in their ad set and location group names and keep the persona id of the
+    ad set they came from. Campaigns over their limit are split the same way
+    by packing whole ad sets. Part keys never reuse a key already in the
+    structure (see part_keys). Structures within the limits are returned
+    unchanged.
+
+    Parameters:
+    - campaigns: Dictionary of Campaign objects (see models.campaigns_from_json)
+    - max_ads_per_ad_set: Maximum number of ads per ad set
+    - max_ads_per_campaign: Maximum number of ads per campaign (optional)
+
+    Returns:
+    - Tuple of (dictionary of packed Campaign objects, report dictionary)
+    """
+    validate_ad_limits(max_ads_per_ad_set, max_ads_per_campaign)
+
+    report = {"ad_sets_split": 0, "ad_sets_created": 0, "campaigns_split": 0, "campaigns_created": 0}
+    packed = {}
+    campaign_keys = set(campaigns)
+
+    for campaign_key, campaign in campaigns.items():
+        ad_sets = {}
+        ad_set_keys = set(campaign.ad_sets)
+        for ad_set_key, ad_set in campaign.ad_sets.items():
+            if ad_set.ad_count <= max_ads_per_ad_set:
+                ad_sets[ad_set_key] = ad_set
+                continue
+            parts = _pack_ad_set(ad_set, max_ads_per_ad_set, ad_set_keys)
+            report["ad_sets_split"] += 1
+            report["ad_sets_created"] += len(parts)
+            for part in parts:
+                ad_sets[part.key] = part
+
+        parts = split_campaign(
+            Campaign(campaign_key, campaign.name, campaign.objective, ad_sets, campaign.daily_budget),
+            max_ads_per_campaign, campaign_keys
+        )
+        if len(parts) > 1:
+            report["campaigns_split"] += 1
+            report["campaigns_created"] += len(parts)
+        for part in parts:
+            packed[part.key] = part
+
+    check_ad_count(
+        sum(campaign.ad_count for campaign in campaigns.values()),
+        sum(campaign.ad_count for campaign in packed.values())
+    )
+    return packed, report
+
+def validate_ad_limits(max_ads_per_ad_set, max_ads_per_campaign=None):
+    """Raise ValueError unless the ad limits can be packed into"""
+    if max_ads_per_ad_set < 1:
+        raise ValueError("max_ads_per_ad_set must be at least 1")
+    if max_ads_per_campaign is not None and max_ads_per_campaign < max_ads_per_ad_set:
+        raise ValueError("max_ads_per_campaign cannot be smaller than max_ads_per_ad_set")
+
+def check_ad_count(expected, actual):
+    """Raise ValueError unless packing kept every ad"""
+    if expected != actual:
+        raise ValueError(f"Packing changed the number of ads from {expected} to {actual}")
+
+def part_keys(key, count, taken):
+    """
+    Keys for the parts of a split ad set or campaign
+
+    Parts are keyed "<key>_<n>" with n counting up from 1, skipping any key in
+    taken, so a part of "family" never replaces an ad set that is really
+    called "family_2". The new keys are added to taken.
+
+    Returns:
+    - List of count keys
+    """
+    keys = []
+    suffix = 0
+    while len(keys) < count:
+        suffix += 1
+        candidate = f"{key}_{suffix}"
+        if candidate not in taken:
+            keys.append(candidate)
+            taken.add(candidate)
+    return keys
+
+def split_campaign(campaign, max_ads_per_campaign, taken_keys):
+    """
+    Split a campaign over its ad limit by packing whole ad sets
+
+    Parameters:
+    - campaign: Campaign to split
+    - max_ads_per_campaign: Maximum number of ads per campaign (None for no limit)
+    - taken_keys: Set of campaign keys in use; part keys are chosen around them and added
+
+    Returns:
+    - List of Campaign objects; just the campaign itself if it fits
+    """
+    if max_ads_per_campaign is None or campaign.ad_count <= max_ads_per_campaign:
+        return [campaign]
+
+    ad_set_keys = list(campaign.ad_sets)
+    assignment, bin_count = _best_fit_decreasing([campaign.ad_sets[key].ad_count for key in ad_set_keys], max_ads_per_campaign)
+    return [
+        Campaign(
+            key,
+            f"{campaign.name} - Part {bin_index + 1}",
+            campaign.objective,
+            {ad_set_key: campaign.ad_sets[ad_set_key] for ad_set_key, assigned in zip(ad_set_keys, assignment) if assigned == bin_index},
+            campaign.daily_budget
+        )
+        for bin_index, key in enumerate(part_keys(campaign.key, bin_count, taken_keys))
+    ]
+
+def ad_set_part(ad_set, key, index, locations):
+    """Part index (from 1) of a split ad set under the given key, keeping the persona id of the ad set"""
+    return AdSet(
+        key, f"{ad_set.name} - Part {index}", ad_set.targeting, locations,
+        ad_set.daily_budget, ad_set.persona_id
+    )
+
+def location_group_part(group, index, ads, ad_count=None):
+    """Location group of part index (from 1) of a split ad set"""
+    return LocationGroup(group.location, f"{group.name} - Part {index}", ads, group.daily_budget, ad_count)
+
+def plan_ad_set_parts(location_sizes, capacity):
+    """
+    Plan how an oversized ad set is split into parts of at most capacity ads
+
+    The ad set is broken into location groups, location groups that are
+    still too large into property type groups, and property type groups into
+    fixed-size chunks; the pieces are then bin packed. Only ad counts are
+    needed, so the plan can be made before any ads are loaded.
+
+    Parameters:
+    - location_sizes: List of (location, [(property_type, ad count), ...]) in ad order
+    - capacity: Maximum number of ads per part
+
+    Returns:
+    - List of parts, each a list of (location, property_type, start, stop)
+      pieces in ad order. property_type is None for a whole location group,
+      otherwise start:stop slices the ads of that property type
+    """
+    pieces = []
+    for location, property_sizes in location_sizes:
+        location_size = sum(count for _, count in property_sizes)
+        if location_size <= capacity:
+            pieces.append((location, None, 0, location_size))
+            continue
+        for property_type, count in property_sizes:
+            for start in range(0, count, capacity):
+                pieces.append((location, property_type, start, min(start + capacity, count)))
+
+    assignment, bin_count = _best_fit_decreasing([stop - start for _, _, start, stop in pieces], capacity)
+
+    parts = [[] for _ in range(bin_count)]
+    for piece, bin_index in zip(pieces, assignment):
+        parts[bin_index].append(piece)
+    return parts
+
+def _pack_ad_set(ad_set, capacity, taken_keys):
+    """Return the parts of an oversized ad set, keyed around the ad set keys in taken_keys"""
+    ads_by_property = {}
+    for location, group in ad_set.locations.items():
+        by_property = {}
+        for ad in group.ads:
+            by_property.setdefault(ad.property_type, []).append(ad)
+        ads_by_property[location] = by_property
+
+    location_sizes = [
+        (location, [(property_type, len(ads)) for property_type, ads in by_property.items()])
+        for location, by_property in ads_by_property.items()
+    ]
+
+    plan = plan_ad_set_parts(location_sizes, capacity)
+    keys = part_keys(ad_set.key, len(plan), taken_keys)
+    parts = []
+    for index, (key, pieces) in enumerate(zip(keys, plan), start=1):
+        location_ads = {}
+        for location, property_type, start, stop in pieces:
+            ads = ad_set.locations[location].ads if property_type is None else ads_by_property[location][property_type][start:stop]
+            location_ads.setdefault(location, []).extend(ads)
+        locations = {
+            location: location_group_part(ad_set.locations[location], index, ads)
+            for location, ads in location_ads.items()
+        }
+        parts.append(ad_set_part(ad_set, key, index, locations))
+    return parts
+
+def _best_fit_decreasing(sizes, capacity):
+    """
+    Assign items to bins of the given capacity
+
+    Items are placed largest first into the open bin with the least room that
+    still fits them, ties going to the oldest bin. Open bins are indexed by
+    their remaining room in a _RoomIndex, so packing n items takes
+    O(n log n + n log capacity).
+
+    Returns:
+    - Tuple of (bin index per item, number of bins)
+    """
+    order = sorted(range(len(sizes)), key=lambda index: -sizes[index])
+    open_bins = _RoomIndex(capacity)
+    assignment = [0] * len(sizes)
+    bin_count = 0
+    for index in order:
+        size = sizes[index]
+        found = open_bins.pop_smallest_fit(size)
+        if found is not None:
+            remaining, bin_index = found
+        else:
+            remaining, bin_index = capacity, bin_count
+            bin_count += 1
+        assignment[index] = bin_index
+        remaining -= size
+        if remaining > 0:
+            open_bins.add(remaining, bin_index)
+    return assignment, bin_count
+
+class _RoomIndex:
+    """
+    Open bins keyed by remaining room
+
+    A segment tree over room values 0..capacity counts the open bins with
+    each room, so the smallest room that fits an item is found in
+    O(log capacity). Bins with the same room are kept in a heap.
+    """
+
+    def __init__(self, capacity):
+        self.leaves = 1 << capacity.bit_length()
+        self.counts = [0] * (2 * self.leaves)
+        self.bins = {}
+
+    def add(self, room, bin_index):
+        heappush(self.bins.setdefault(room, []), bin_index)
+        self._update(room, 1)
+
+    def pop_smallest_fit(self, size):
+        """Remove and return (room, bin index) of the open bin with the smallest room >= size, or None"""
+        node = size + self.leaves
+        if not self.counts[node]:
+            # Climb until a right sibling holds an open bin, then descend to its leftmost one
+            while node % 2 == 1 or not self.counts[node + 1]:
+                node //= 2
+                if node <= 1:
+                    return None
+            node += 1
+            while node < self.leaves:
+                node = 2 * node if self.counts[2 * node] else 2 * node + 1
+
+        room = node - self.leaves
+        bin_index = heappop(self.bins[room])
+        self._update(room, -1)
+        return room, bin_index
+
+    def _update(self, room, delta):
+        node = room + self.leaves
+        while node:
+            self.counts[node] += delta
+            node //= 2
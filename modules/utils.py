@@ -3,6 +3,12 @@ import streamlit as st
 import pandas as pd
 import json
 
+@st.cache_resource
+def load_text_asset(path):
+    """Read a static text asset once per process"""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
 def display_instructions(text):
     """Display instructions in a clean info box"""
     st.info(text)
@@ -14,27 +20,29 @@ def preview_dataframe(df, rows=5):
     with st.expander("See all data"):
         st.dataframe(df)
 
-def preview_json(json_data):
-    """Display a preview of JSON data"""
+def preview_json(campaigns):
+    """Display a preview of the campaign structure from its Campaign objects"""
     # Show first level keys
     st.write("Campaign Structure Overview:")
+    st.write(f"{len(campaigns)} campaigns, {sum(c.ad_set_count for c in campaigns.values())} ad sets, {sum(c.ad_count for c in campaigns.values())} ads")
     
-    for key in json_data:
-        st.write(f"Campaign: {json_data[key]['name']}")
+    for campaign in campaigns.values():
+        st.write(f"Campaign: {campaign.name}")
         
         # Expandable section for each campaign
-        with st.expander(f"View details for {json_data[key]['name']}"):
-            st.write(f"- Objective: {json_data[key]['objective']}")
-            st.write(f"- Number of ad sets: {len(json_data[key]['ad_sets'])}")
+        with st.expander(f"View details for {campaign.name}"):
+            st.write(f"- Objective: {campaign.objective}")
+            if campaign.daily_budget is not None:
+                st.write(f"- Daily budget: {campaign.daily_budget:.2f}")
+            st.write(f"- Number of ad sets: {campaign.ad_set_count}")
             
             # Ad sets
-            for ad_set_key, ad_set in json_data[key]['ad_sets'].items():
-                st.write(f"  - Ad Set: {ad_set['name']}")
-                st.write(f"    - Targeting: {ad_set['targeting']}")
-                
-                # Count total ads
-                total_ads = sum(len(location['ads']) for location in ad_set['locations'].values())
-                st.write(f"    - Total ads: {total_ads}")
+            for ad_set in campaign.ad_sets.values():
+                st.write(f"  - Ad Set: {ad_set.name}")
+                st.write(f"    - Targeting: {ad_set.targeting}")
+                if ad_set.daily_budget is not None:
+                    st.write(f"    - Daily budget: {ad_set.daily_budget:.2f}")
+                st.write(f"    - Total ads: {ad_set.ad_count}")
 
 def create_directory_if_not_exists(directory):
     """Create directory if it doesn't exist"""
@@ -44,9 +52,54 @@ def create_directory_if_not_exists(directory):
         return True
     return False
 
+def parse_weight_lines(text):
+    """Parse 'name: weight' lines into a dictionary"""
+    weights = {}
+    for line in text.strip().split("\n"):
+        if not line.strip():
+            continue
+        if ":" not in line:
+            raise ValueError(f"Expected 'name: weight', got '{line.strip()}'")
+        name, value = line.rsplit(":", 1)
+        weights[name.strip()] = float(value)
+    return weights
+
 def validate_csv_format(df, required_columns):
     """Validate that a DataFrame has the required columns"""
     missing_columns = [col for col in required_columns if col not in df.columns]
     if missing_columns:
         return False, f"Missing required columns: {', '.join(missing_columns)}"
-    return True, "CSV format is valid"
\ No newline at end of file
+    return True, "CSV format is valid"
+
+def display_job_progress(job, poll_interval=0.5):
+    """
+    Display the progress of a background job
+    
+    While the job is running this shows a progress bar with a cancel button in
+    a fragment that polls every poll_interval seconds, so only the progress
+    section is redrawn. Once the job is done the whole page reruns to show its
+    results.
+    
+    Returns:
+    - True if the job has completed successfully
+    """
+    if job is None:
+        return False
+    
+    if not job.done:
+        st.fragment(run_every=poll_interval)(_job_progress_section)(job)
+        return False
+    
+    if job.status == "failed":
+        st.error(f"{job.label} failed: {job.error}")
+    elif job.status == "cancelled":
+        st.warning(f"{job.label} was cancelled")
+    
+    return job.status == "completed"
+
+def _job_progress_section(job):
+    if job.done:
+        st.rerun()
+    st.progress(job.progress, text=f"{job.label}: {job.message}")
+    if st.button("Cancel", key=f"cancel_{job.job_id}"):
+        job.cancel()